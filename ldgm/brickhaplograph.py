@@ -1,13 +1,41 @@
 """
 Create a brick graph
 """
-import itertools
-
-import networkx as nx
 import numpy as np
+import tskit
 from tqdm import tqdm
 
-from . import utility
+from . import brickindex
+from . import graph
+
+
+# Tags of the brick-haplo graph edges created by each rule. The graph without
+# rule two is the graph without RULE_ONE_UTURN and RULE_TWO edges.
+RULE_ZERO = 0
+RULE_ONE = 1
+RULE_ONE_UTURN = 2
+RULE_TWO = 3
+
+
+def without_sibs(brick_graph):
+    """
+    Returns the brick-haplo graph which would have been made with
+    make_sibs=False, given the tagged CSRGraph made with make_sibs=True.
+    """
+    return brick_graph.filter_edges(
+        ~np.isin(brick_graph.tags, [RULE_ONE_UTURN, RULE_TWO])
+    )
+
+
+def reduced_vertices(labeled, num_vertices):
+    """
+    Returns a boolean mask of the brick-haplo graph vertices which can appear in
+    the reduced graph: the vertices of labeled bricks and of haplotypes. The
+    vertices of unlabeled bricks only carry paths between them.
+    """
+    vertices = np.arange(num_vertices)
+    bricks = np.minimum(vertices // 8, len(labeled) - 1)
+    return (vertices % 8 >= 6) | labeled[bricks]
 
 
 class BrickHaploGraph:
@@ -31,261 +59,262 @@ class BrickHaploGraph:
     """
 
     def __init__(
-        self, bricked_ts, edge_weight_threshold, make_sibs=False, progress=True
+        self,
+        bricked_ts,
+        edge_weight_threshold,
+        make_sibs=False,
+        progress=True,
+        brick_index=None,
     ):
         self.bricked_ts = bricked_ts
         self.edge_weight_threshold = edge_weight_threshold
-        self.brick_graph = nx.DiGraph()
-        self.freqs = utility.get_brick_frequencies(self.bricked_ts)
+        self.builder = graph.GraphBuilder()
+        if brick_index is None:
+            brick_index = brickindex.BrickIndex.from_ts(bricked_ts, progress=progress)
+        self.brick_index = brick_index
+        self.labeled = brick_index.labeled
+        self.freqs = brick_index.freqs
         self.progress = progress
         self.make_sibs = make_sibs
 
-    def find_odds(self, brick):
-        if self.freqs[brick] == 1:
-            raise ZeroDivisionError("Cannot have a brick with frequency 1")
-        if self.freqs[brick] == 0:
+    def brick_odds(self):
+        """
+        Returns the odds freq / (1 - freq) of every brick, which must have a
+        frequency strictly between zero and one.
+        """
+        invalid = np.where((self.freqs == 0) | (self.freqs == 1))[0]
+        if len(invalid) > 0:
+            if self.freqs[invalid[0]] == 1:
+                raise ZeroDivisionError("Cannot have a brick with frequency 1")
             raise ValueError("Cannot have brick with frequency 0")
-        odds = self.freqs[brick] / (1 - self.freqs[brick])
-        assert odds != 0, (odds, self.freqs[brick])
-        return odds
+        return self.freqs / (1 - self.freqs)
 
-    def log_odds(self, odds):
-        if odds == 0:
-            raise ValueError("Cannot have odds of zero")
-        if odds != 1:
-            return np.log(odds) * -1
-        else:
-            return np.log(odds)
+    def rule_one_weights(self, bricks_a, bricks_b):
+        """
+        Rule one weights |log(odds_a / odds_b)| of arrays of brick pairs
+        """
+        return np.abs(np.log(self.odds[bricks_a] / self.odds[bricks_b]))
 
-    def add_edge_threshold(self, from_node, to_node, weight):
-        if self.edge_weight_threshold is not None:
-            if weight < self.edge_weight_threshold:
-                self.brick_graph.add_edge(from_node, to_node, weight=weight)
-        else:
-            self.brick_graph.add_edge(from_node, to_node, weight=weight)
+    def rule_two_weights(self, bricks_a, bricks_b):
+        """
+        Rule two weights |log(odds_a * odds_b)| of arrays of brick pairs
+        """
+        return np.abs(np.log(self.odds[bricks_a] * self.odds[bricks_b]))
 
-    def vertex(self, identifier, down, after, out, uturn, haplo):
+    def below_threshold(self, weights):
         """
-        Function to convert haplo/brick ID to desired vertex id.
-        identifier is the haplotype (node) or brick id from the tree sequence.
-        Down is a bool, if true, refer to the down vertex.
-        After is a bool, referring to after vertex
-        Out indicates out vertex of labeled brick
-        Haplo indicates if identifier refers to a haplotype
+        Mask of the weights which are below the edge weight threshold
         """
-        vertex_id = 8 * identifier
-        if out:
-            if identifier in self.labeled_bricks:
-                return vertex_id + 4
-            else:
-                raise ValueError("vertex not a labeled brick")
-        if uturn:
-            return vertex_id + 5
-        if down:
-            vertex_id += 2
-            if haplo:
-                raise ValueError("Haplos cannot be down")
-        if after:
-            vertex_id += 1
-        if haplo:
-            vertex_id += 6
-        return vertex_id
+        if self.edge_weight_threshold is None:
+            return np.ones(len(weights), dtype=bool)
+        return weights < self.edge_weight_threshold
 
-    def connect_vertices(
-        self,
-        id_a,
-        id_b,
-        child=None,
-        out=False,
-        down_a=False,
-        down_b=False,
-        after_a=False,
-        after_b=False,
-        uturn_a=False,
-        uturn_b=False,
-        haplo=False,
-        reverse_odds=False,
-        combine_odds="rule_one",
-    ):
+    def connect(self, vertices_a, vertices_b, weights, rule):
         """
-        Up and before are default for both verticies
+        Add edges from the arrays vertices_a to vertices_b with the given weights,
+        tagged with the rule which created them
         """
-        # Both vertices cannot be uturns
-        assert ~(uturn_a is True and uturn_b is True)
-        vertex_a = self.vertex(
-            id_a, out=out, after=after_a, down=down_a, uturn=uturn_a, haplo=False
-        )
-        vertex_b = self.vertex(
-            id_b, out=False, after=after_b, down=down_b, uturn=uturn_b, haplo=haplo
-        )
-        odds_a = self.find_odds(id_a)
-        odds_b = self.find_odds(id_b)
-        if combine_odds == "rule_one":
-            if odds_b == 0:
-                raise ValueError("odds of sink brick are 0")
-            weight = abs(self.log_odds(odds_a / odds_b))
-        elif combine_odds == "rule_two":
-            weight = abs(self.log_odds(odds_a * odds_b))
-        elif combine_odds == "haplo":
-            weight = self.log_odds(1)
-        else:
-            raise ValueError("Incorrect combine_odds method")
-        self.add_edge_threshold(vertex_a, vertex_b, weight)
+        self.builder.add_edges(vertices_a, vertices_b, weights, rule)
 
-    def rule_one(self, edge, children, roots):
+    def rule_zero(self):
+        """
+        Rule 0:
+        Connect each brick to its child haplotype, with weight log(1)
+        """
+        weight = 0.0
+        if not self.below_threshold(np.array([weight]))[0]:
+            return
+        bricks = 8 * np.arange(self.bricked_ts.num_edges, dtype=np.int32)
+        haplos = 8 * self.bricked_ts.tables.edges.child
+        labeled = self.labeled
+        # If brick is labeled: down before to after of child haplotype
+        # Else if brick is unlabeled, down before of brick to before
+        # of child haplotype
+        self.connect(bricks + 2, haplos + 6 + labeled, weight, RULE_ZERO)
+        # Down after of brick to after of child haplotype
+        self.connect(bricks + 3, haplos + 7, weight, RULE_ZERO)
+        # Out of labeled brick to before of child haplotype
+        self.connect(bricks[labeled] + 4, haplos[labeled] + 6, weight, RULE_ZERO)
+
+    def rule_one_pairs(self):
+        """
+        Returns arrays of the distinct (parent brick, child brick) pairs. A brick
+        enters only one tree, so the new pairs of each tree are those from the
+        bricks entering it to their children and to their parent. A pair of
+        bricks entering the same tree is taken from the parent's children only.
+        """
+        tree_bricks = self.brick_index.tree_bricks
+        entry_trees = self.brick_index.entry_trees
+        num_children = np.diff(tree_bricks.child_offsets)
+        has_parent = tree_bricks.parent_bricks != tskit.NULL
+        has_parent[has_parent] = (
+            entry_trees[tree_bricks.parent_bricks[has_parent]]
+            != entry_trees[tree_bricks.bricks[has_parent]]
+        )
+        parents = np.concatenate(
+            [
+                np.repeat(tree_bricks.bricks, num_children),
+                tree_bricks.parent_bricks[has_parent],
+            ]
+        ).astype(np.int32)
+        children = np.concatenate(
+            [tree_bricks.child_bricks, tree_bricks.bricks[has_parent]]
+        ).astype(np.int32)
+        assert np.all(parents != children)
+        return parents, children
+
+    def rule_one(self, parents, children):
         """
         Rule 1:
-        Connect focal brick (indexed by edge.child) to its child bricks
+        Connect arrays of parent bricks to their child bricks
         """
-        focal_node = edge.child
-
-        def do_rule_one(parent, child):
-            labeled_parent = self.node_edge_dict[parent] in self.labeled_bricks
-            labeled_child = self.node_edge_dict[child] in self.labeled_bricks
-            assert self.node_edge_dict[child] != self.node_edge_dict[parent]
-
-            # Up after of child to up after of parent
-            self.connect_vertices(
-                self.node_edge_dict[child],
-                self.node_edge_dict[parent],
-                after_a=True,
-                after_b=True,
-            )
-
-            # Down after of parent to down after of child
-            self.connect_vertices(
-                self.node_edge_dict[parent],
-                self.node_edge_dict[child],
-                after_a=True,
-                after_b=True,
-                down_a=True,
-                down_b=True,
+        # Every connection between a parent and child has the same weight
+        weights = self.rule_one_weights(parents, children)
+        keep = self.below_threshold(weights)
+        weights = weights[keep]
+        labeled_parent = self.labeled[parents[keep]]
+        labeled_child = self.labeled[children[keep]]
+        parents = 8 * parents[keep]
+        children = 8 * children[keep]
+
+        # Up after of child to up after of parent
+        self.connect(children + 1, parents + 1, weights, RULE_ONE)
+        # Down after of parent to down after of child
+        self.connect(parents + 3, children + 3, weights, RULE_ONE)
+        # Up before of child to EITHER up before of parent (if child is unlabeled)
+        # or up after of parent (if child is labeled)
+        self.connect(children, parents + labeled_child, weights, RULE_ONE)
+        # Down before of parent to EITHER down before of child
+        # (if parent is unlabeled) or down after of child (if parent is labeled)
+        self.connect(parents + 2, children + 2 + labeled_parent, weights, RULE_ONE)
+
+        # If parent brick is labeled, out of parent to down before of child
+        self.connect(
+            parents[labeled_parent] + 4,
+            children[labeled_parent] + 2,
+            weights[labeled_parent],
+            RULE_ONE,
+        )
+        # If child brick is labeled, out of child to up before of parent
+        self.connect(
+            children[labeled_child] + 4,
+            parents[labeled_child],
+            weights[labeled_child],
+            RULE_ONE,
+        )
+        if self.make_sibs:
+            # uturn of labeled parent to down before of ANY child
+            self.connect(
+                parents[labeled_parent] + 5,
+                children[labeled_parent] + 2,
+                weights[labeled_parent],
+                RULE_ONE_UTURN,
             )
-
-            # Up before of child to EITHER up before of parent (if child is unlabeled)
-            # or up after of parent (if child is labeled)
-            self.connect_vertices(
-                self.node_edge_dict[child],
-                self.node_edge_dict[parent],
-                after_b=labeled_child,
+            # EITHER out of labeled child (if child is labeled) or up before
+            # of unlabeled child to uturn of labeled parent
+            self.connect(
+                children[labeled_parent] + 4 * labeled_child[labeled_parent],
+                parents[labeled_parent] + 5,
+                weights[labeled_parent],
+                RULE_ONE_UTURN,
             )
 
-            # Down before of parent to EITHER down before of child
-            # (if parent is unlabeled) or down after of child (if parent is labeled)
-            self.connect_vertices(
-                self.node_edge_dict[parent],
-                self.node_edge_dict[child],
-                down_a=True,
-                down_b=True,
-                after_b=labeled_parent,
+    def sibling_pairs(self):
+        """
+        Returns arrays of the unordered sibling brick pairs to connect by rule two.
+        A brick entering a tree connects all its siblings if its own rule two
+        weight is below the threshold. Each sibling set is handled once per tree,
+        and emits only the pairs containing a brick that entered since the set was
+        last connected: the other pairs have already been emitted. Pairs whose
+        rule two weight |log_odds_a + log_odds_b| is above the threshold are not
+        enumerated, by sorting each sibling set by log odds.
+        """
+        tree_bricks = self.brick_index.tree_bricks
+        sibling_offsets = tree_bricks.sibling_offsets
+        entry_trees = self.brick_index.entry_trees
+        num_groups = len(sibling_offsets) - 1
+        active = (
+            np.bincount(
+                tree_bricks.sibling_groups,
+                weights=self.rule_two_bricks[tree_bricks.bricks],
+                minlength=num_groups,
             )
+            > 0
+        )
+        _, first_index = np.unique(tree_bricks.sibling_groups, return_index=True)
+        group_bricks = tree_bricks.bricks[first_index]
+        group_parents = self.bricked_ts.tables.edges.parent[group_bricks]
+        group_trees = entry_trees[group_bricks]
+        last_connected = np.full(self.bricked_ts.num_nodes, -1, dtype=np.int64)
 
-            # If parent brick is labeled, make out and uturn connections
-            if labeled_parent:
-                # Out of parent to down before of child
-                self.connect_vertices(
-                    self.node_edge_dict[parent],
-                    self.node_edge_dict[child],
-                    out=True,
-                    down_b=True,
+        threshold = np.inf
+        if self.edge_weight_threshold is not None:
+            # Widened so rounding never skips a pair: the exact weights are
+            # thresholded again by rule_two()
+            threshold = self.edge_weight_threshold + 1e-9
+        log_odds = np.log(self.odds)
+        bricks_a = []
+        bricks_b = []
+        for group in tqdm(
+            np.where(active)[0],
+            desc="Brick graph: connect siblings",
+            disable=not self.progress,
+        ):
+            first = sibling_offsets[group]
+            last = sibling_offsets[group + 1]
+            siblings = tree_bricks.sibling_bricks[first:last]
+            parent = group_parents[group]
+            new = entry_trees[siblings] > last_connected[parent]
+            last_connected[parent] = group_trees[group]
+            order = np.argsort(log_odds[siblings], kind="stable")
+            siblings = siblings[order]
+            new = new[order]
+            sibling_log_odds = log_odds[siblings]
+            for position in np.where(new)[0]:
+                start = np.searchsorted(
+                    sibling_log_odds, -threshold - sibling_log_odds[position], "right"
                 )
-                if self.make_sibs:
-                    # uturn of labeled parent to down before of ANY child
-                    self.connect_vertices(
-                        self.node_edge_dict[parent],
-                        self.node_edge_dict[child],
-                        uturn_a=True,
-                        down_b=True,
-                    )
-            if labeled_child:
-                # out of child to up before of parent
-                self.connect_vertices(
-                    self.node_edge_dict[child],
-                    self.node_edge_dict[parent],
-                    out=True,
+                stop = np.searchsorted(
+                    sibling_log_odds, threshold - sibling_log_odds[position], "left"
                 )
-                if labeled_parent:
-                    # out of labeled child to uturn of labeled parent
-                    if self.make_sibs:
-                        self.connect_vertices(
-                            self.node_edge_dict[child],
-                            self.node_edge_dict[parent],
-                            out=True,
-                            uturn_b=True,
-                        )
-            elif labeled_parent:
-                # up before of UNLABELED CHILD to uturn of labeled parent
-                if self.make_sibs:
-                    self.connect_vertices(
-                        self.node_edge_dict[child],
-                        self.node_edge_dict[parent],
-                        uturn_b=True,
-                    )
-
-        for child in children:
-            do_rule_one(focal_node, child)
-
-        # Connect focal brick to its parent brick, making same connections as above
-        if edge.parent not in roots and focal_node not in roots:
-            assert self.node_edge_dict[focal_node] != self.node_edge_dict[edge.parent]
-            do_rule_one(edge.parent, focal_node)
-
-    def rule_two(self, edge, siblings):
-        # Rule 2: Connect focal brick to its siblings
-        if len(siblings) > 1:
-            for pair_combo in itertools.combinations(siblings, 2):
-                for pair in (
-                    (pair_combo[0], pair_combo[1]),
-                    (pair_combo[1], pair_combo[0]),
-                ):
-                    assert pair[0] != pair[1]
-
-                    labeled_0 = self.node_edge_dict[pair[0]] in self.labeled_bricks
-                    # Up after left to down after right
-                    self.connect_vertices(
-                        self.node_edge_dict[pair[0]],
-                        self.node_edge_dict[pair[1]],
-                        after_a=True,
-                        after_b=True,
-                        down_b=True,
-                        combine_odds="rule_two",
-                    )
-
-                    # If left is labeled, left up before to right down after.
-                    # If left is not labeled, we do left up before to right down before.
-                    self.connect_vertices(
-                        self.node_edge_dict[pair[0]],
-                        self.node_edge_dict[pair[1]],
-                        down_b=True,
-                        after_b=labeled_0,
-                        combine_odds="rule_two",
-                    )
-
-                    # If brick 0 in sibling pair is labeled, make out connections
-                    if labeled_0:
-                        # Out to down before
-                        self.connect_vertices(
-                            self.node_edge_dict[pair[0]],
-                            self.node_edge_dict[pair[1]],
-                            out=True,
-                            down_b=True,
-                            combine_odds="rule_two",
-                        )
-
-    def make_connections(self, edge, tree2, index):
-        roots = tree2.roots
-        children = tree2.children(edge.child)
-        siblings = tree2.children(edge.parent)
-        self.rule_one(edge, children, roots)
-        if self.make_sibs:
-            if self.edge_weight_threshold is not None:
-                if (
-                    self.log_odds(self.find_odds(edge.id) ** 2)
-                    < self.edge_weight_threshold
-                ):
-                    self.rule_two(edge, siblings)
-            else:
-                self.rule_two(edge, siblings)
+                partners = np.arange(start, stop)
+                # A pair of new bricks is emitted by the first brick of the pair
+                partners = partners[~new[partners] | (partners > position)]
+                bricks_a.append(np.full(len(partners), siblings[position]))
+                bricks_b.append(siblings[partners])
+        if len(bricks_a) == 0:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+        bricks_a = np.concatenate(bricks_a).astype(np.int32)
+        bricks_b = np.concatenate(bricks_b).astype(np.int32)
+        assert np.all(bricks_a != bricks_b)
+        return bricks_a, bricks_b
+
+    def rule_two(self, bricks_a, bricks_b):
+        """
+        Rule 2:
+        Connect arrays of sibling bricks to each other, in both directions
+        """
+        weights = self.rule_two_weights(bricks_a, bricks_b)
+        keep = self.below_threshold(weights)
+        weights = weights[keep]
+        bricks_a = bricks_a[keep]
+        bricks_b = bricks_b[keep]
+        for left, right in [(bricks_a, bricks_b), (bricks_b, bricks_a)]:
+            labeled_left = self.labeled[left]
+            left = 8 * left
+            right = 8 * right
+            # Up after left to down after right
+            self.connect(left + 1, right + 3, weights, RULE_TWO)
+            # If left is labeled, left up before to right down after.
+            # If left is not labeled, we do left up before to right down before.
+            self.connect(left, right + 2 + labeled_left, weights, RULE_TWO)
+            # If left is labeled, out to down before
+            self.connect(
+                left[labeled_left] + 4,
+                right[labeled_left] + 2,
+                weights[labeled_left],
+                RULE_TWO,
+            )
 
     def make_brick_graph(self):
         """
@@ -294,78 +323,39 @@ class BrickHaploGraph:
         1. Connect parent and child bricks
         2. Connect sibling bricks
         """
-        bricks_to_muts = utility.get_mut_edges(self.bricked_ts)
-        self.labeled_bricks = np.array(list(bricks_to_muts.keys()))
+        self.labeled_bricks = np.where(self.labeled)[0]
         # The number of labeled bricks should be less than or equal to the number of SNPs
         # as well as the number of bricks
         assert len(self.labeled_bricks) <= self.bricked_ts.num_mutations
         assert len(self.labeled_bricks) <= self.bricked_ts.num_edges
-        bricks = np.arange(0, self.bricked_ts.num_edges)
-        assert len(bricks) == self.bricked_ts.num_edges
-        self.unlabeled_bricks = bricks[~np.isin(bricks, self.labeled_bricks)]
-        # There should be no overlap between labeled and unlabeled bricks
-        assert len(np.intersect1d(self.labeled_bricks, self.unlabeled_bricks)) == 0
+        assert len(self.labeled) == self.bricked_ts.num_edges
+        self.unlabeled_bricks = np.where(~self.labeled)[0]
         # The number of unlabeled bricks should be greater than the number of edges minus
         # the number of SNPs
         assert len(self.unlabeled_bricks) >= (
             self.bricked_ts.num_edges - self.bricked_ts.num_mutations
-        ), (len(bricks), self.bricked_ts.num_mutations, len(self.unlabeled_bricks))
-
-        self.node_edge_dict = {}
+        ), (
+            self.bricked_ts.num_edges,
+            self.bricked_ts.num_mutations,
+            len(self.unlabeled_bricks),
+        )
 
-        # Rule Zero
-        # Connect each brick to its child haplotype
-        for brick in self.bricked_ts.edges():
-            labeled_brick = brick.id in self.labeled_bricks
-            # If brick is labeled: down before to after of child haplotype
-            # Else if brick is unlabeled, down before of brick to before
-            # of child haplotype
-            self.connect_vertices(
-                brick.id,
-                brick.child,
-                down_a=True,
-                after_b=labeled_brick,
-                haplo=True,
-                combine_odds="haplo",
-            )
-            # Down after of brick to after of child haplotype
-            self.connect_vertices(
-                brick.id,
-                brick.child,
-                down_a=True,
-                after_a=True,
-                after_b=True,
-                haplo=True,
-                combine_odds="haplo",
-            )
-            if labeled_brick:
-                # Out of brick to before of child haplotype
-                self.connect_vertices(
-                    brick.id,
-                    brick.child,
-                    out=True,
-                    haplo=True,
-                    combine_odds="haplo",
-                )
+        self.odds = self.brick_odds()
+        # Siblings are only connected when a focal brick's own rule two weight,
+        # -log(odds ** 2), is below the threshold
+        self.rule_two_bricks = self.below_threshold(-np.log(self.odds**2))
 
-        for index, (tree2, (_, edges_out, edges_in)) in tqdm(
-            enumerate(zip(self.bricked_ts.trees(), self.bricked_ts.edge_diffs())),
-            desc="Brick graph: iterate over trees",
-            total=self.bricked_ts.num_trees,
-            disable=not self.progress,
-        ):
-            self.prev_edge_dict = self.node_edge_dict.copy()
+        self.rule_zero()
+        self.rule_one(*self.rule_one_pairs())
 
-            for edge in edges_out:
-                self.node_edge_dict.pop(edge.child)
-            for edge in edges_in:
-                self.node_edge_dict[edge.child] = edge.id
-            for edge in edges_in:
-                self.make_connections(edge, tree2, index)
+        if self.make_sibs:
+            self.rule_two(*self.sibling_pairs())
 
         # Sanity checks
         # No connections from a haplotype vertex pointing outwards
         # TODO check vertices 5 and 6 never start an edge
         # Vertex 7 is never used
         # Out is never second position in an edge
+        num_vertices = 8 * max(self.bricked_ts.num_edges, self.bricked_ts.num_nodes)
+        self.brick_graph = self.builder.finalize(num_vertices=num_vertices)
         return self.brick_graph
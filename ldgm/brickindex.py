@@ -0,0 +1,193 @@
+"""
+An index of the bricks in a bricked tree sequence, which is computed once and
+shared by every step of creating an LDGM
+"""
+import collections
+
+import numpy as np
+import tskit
+from tqdm import tqdm
+
+
+# The result of a single traversal of a bricked tree sequence:
+# freqs: frequency of each brick in the tree where it first appears
+# mut_bricks: the brick each mutation occurs on (-1 if it is above a root)
+# tree_bricks: a TreeBricks tuple, see below
+BrickTraversal = collections.namedtuple(
+    "BrickTraversal", ["freqs", "mut_bricks", "tree_bricks"]
+)
+
+# The node->brick map of each tree, resolved for the bricks entering that tree.
+# Each array is flattened across trees, with the bricks entering tree i given by
+# bricks[tree_offsets[i]:tree_offsets[i + 1]]. For the jth entering brick:
+# parent_bricks[j]: the brick above its parent node (-1 if the parent is a root)
+# child_bricks[child_offsets[j]:child_offsets[j + 1]]: bricks above its children
+# sibling_bricks[sibling_offsets[k]:sibling_offsets[k + 1]], where
+# k = sibling_groups[j]: bricks above the children of its parent node. Bricks
+# entering the same tree with the same parent node share a sibling group.
+TreeBricks = collections.namedtuple(
+    "TreeBricks",
+    [
+        "tree_offsets",
+        "bricks",
+        "parent_bricks",
+        "child_offsets",
+        "child_bricks",
+        "sibling_groups",
+        "sibling_offsets",
+        "sibling_bricks",
+    ],
+)
+
+
+def traverse_bricks(ts, progress=False):
+    """
+    Computes brick frequencies, the mutation->brick map and the per-tree
+    node->brick map of a bricked tree sequence in a single pass over its trees.
+    Returns a BrickTraversal tuple.
+    """
+    freqs = np.zeros(ts.num_edges)
+    mut_bricks = np.full(ts.num_mutations, tskit.NULL, dtype=np.int32)
+    tree_offsets = [0]
+    bricks = []
+    parent_bricks = []
+    child_offsets = [0]
+    child_bricks = []
+    sibling_groups = []
+    sibling_offsets = [0]
+    sibling_bricks = []
+
+    node_edge_dict = {}
+    for tree, (_, edges_out, edges_in) in tqdm(
+        zip(ts.trees(), ts.edge_diffs()),
+        desc="Traverse bricks: iterate over trees",
+        total=ts.num_trees,
+        disable=not progress,
+    ):
+        for edge in edges_out:
+            node_edge_dict.pop(edge.child)
+        for edge in edges_in:
+            node_edge_dict[edge.child] = edge.id
+        parent_groups = {}
+        for edge in edges_in:
+            # assert that we've never seen the brick before
+            assert freqs[edge.id] == 0
+            freqs[edge.id] = tree.num_samples(edge.child) / tree.num_samples()
+            bricks.append(edge.id)
+            parent_bricks.append(node_edge_dict.get(edge.parent, tskit.NULL))
+            child_bricks.extend(
+                node_edge_dict[child] for child in tree.children(edge.child)
+            )
+            child_offsets.append(len(child_bricks))
+            if edge.parent not in parent_groups:
+                parent_groups[edge.parent] = len(sibling_offsets) - 1
+                sibling_bricks.extend(
+                    node_edge_dict[sibling] for sibling in tree.children(edge.parent)
+                )
+                sibling_offsets.append(len(sibling_bricks))
+            sibling_groups.append(parent_groups[edge.parent])
+        tree_offsets.append(len(bricks))
+        for site in tree.sites():
+            for mut in site.mutations:
+                if mut.node in node_edge_dict:
+                    mut_bricks[mut.id] = node_edge_dict[mut.node]
+
+    tree_bricks = TreeBricks(
+        tree_offsets=np.array(tree_offsets),
+        bricks=np.array(bricks, dtype=np.int32),
+        parent_bricks=np.array(parent_bricks, dtype=np.int32),
+        child_offsets=np.array(child_offsets),
+        child_bricks=np.array(child_bricks, dtype=np.int32),
+        sibling_groups=np.array(sibling_groups),
+        sibling_offsets=np.array(sibling_offsets),
+        sibling_bricks=np.array(sibling_bricks, dtype=np.int32),
+    )
+    return BrickTraversal(
+        freqs=freqs,
+        mut_bricks=mut_bricks,
+        tree_bricks=tree_bricks,
+    )
+
+
+class BrickIndex:
+    """
+    Arrays describing the bricks (edges) of a bricked tree sequence:
+    labeled: boolean mask, True for bricks carrying at least one mutation
+    mut_bricks: the brick each mutation occurs on (-1 if it is above a root)
+    brick_mut_offsets, brick_muts: the mutations on brick b are
+        brick_muts[brick_mut_offsets[b]:brick_mut_offsets[b + 1]], in
+        increasing ID order
+    first_muts: the first mutation on each brick (-1 for unlabeled bricks),
+        which is the node ID of the brick in the reduced graph
+    ldgm_ids: the node ID of each labeled brick in the LDGM (-1 for unlabeled
+        bricks). Labeled bricks are numbered in order of their first mutation.
+    freqs: frequency of each brick
+    log_odds: log(freq / (1 - freq)) of each brick
+    tree_bricks: the per-tree node->brick map, see TreeBricks
+    entry_trees: the index of the tree each brick enters
+    """
+
+    def __init__(self, traversal, num_edges):
+        self.freqs = traversal.freqs
+        with np.errstate(divide="ignore"):
+            self.log_odds = np.log(self.freqs) - np.log(1 - self.freqs)
+        self.mut_bricks = traversal.mut_bricks
+        self.tree_bricks = traversal.tree_bricks
+        self.num_bricks = num_edges
+        tree_offsets = self.tree_bricks.tree_offsets
+        self.entry_trees = np.zeros(num_edges, dtype=np.int64)
+        self.entry_trees[self.tree_bricks.bricks] = np.repeat(
+            np.arange(len(tree_offsets) - 1), np.diff(tree_offsets)
+        )
+
+        on_brick = np.where(self.mut_bricks != tskit.NULL)[0]
+        # A stable sort keeps the mutations on each brick in increasing ID order
+        self.brick_muts = on_brick[
+            np.argsort(self.mut_bricks[on_brick], kind="stable")
+        ].astype(np.int32)
+        self.brick_mut_offsets = np.zeros(num_edges + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(self.mut_bricks[on_brick], minlength=num_edges),
+            out=self.brick_mut_offsets[1:],
+        )
+        self.labeled = self.brick_mut_offsets[1:] > self.brick_mut_offsets[:-1]
+
+        self.first_muts = np.full(num_edges, tskit.NULL, dtype=np.int32)
+        self.first_muts[self.labeled] = self.brick_muts[
+            self.brick_mut_offsets[:-1][self.labeled]
+        ]
+        self.ldgm_ids = np.full(num_edges, tskit.NULL, dtype=np.int32)
+        labeled_bricks = np.where(self.labeled)[0]
+        self.labeled_order = labeled_bricks[
+            np.argsort(self.first_muts[labeled_bricks], kind="stable")
+        ]
+        self.ldgm_ids[self.labeled_order] = np.arange(len(self.labeled_order))
+
+    @classmethod
+    def from_ts(cls, bricked_ts, progress=False):
+        """
+        Build a BrickIndex from a bricked tree sequence.
+        """
+        return cls(traverse_bricks(bricked_ts, progress=progress), bricked_ts.num_edges)
+
+    @property
+    def num_labeled(self):
+        return len(self.labeled_order)
+
+    def muts(self, brick):
+        """
+        Returns the mutations on the given brick.
+        """
+        start = self.brick_mut_offsets[brick]
+        stop = self.brick_mut_offsets[brick + 1]
+        return self.brick_muts[start:stop]
+
+    def bricks_to_muts(self):
+        """
+        Returns a dictionary with keys = labeled brick ids and values = lists
+        of mutation ids, ordered by first mutation like
+        ``ldgm.utility.get_mut_edges()``.
+        """
+        return {
+            int(brick): self.muts(brick).tolist() for brick in self.labeled_order
+        }
@@ -2,25 +2,214 @@
 Contains code to create a "bricked" tree sequence, where edges with
 have different sets of descendants are bifurcated.
 """
+import json
+import multiprocessing
+
+import numpy as np
 import tskit
 from tqdm import tqdm
-import json
 
 from . import utility
 
 
+class EdgeSplitter:
+    """
+    Finds the positions at which edges are bifurcated. Sweeps along the
+    breakpoints of a tree sequence, keeping numpy parent arrays for the marginal
+    trees to the left ("before") and right ("after") of each breakpoint. These
+    arrays are updated in place from the edges leaving and entering the tree at
+    each breakpoint (as given by ``ts.edge_diffs()``), which are computed here
+    from the columns of the edge table.
+    """
+
+    def __init__(self, tables, recombination_freq_threshold=0, progress=False):
+        self.left = tables.edges.left
+        self.right = tables.edges.right
+        self.parent = tables.edges.parent
+        self.child = tables.edges.child
+        self.node_time = tables.nodes.time
+        self.num_nodes = tables.nodes.num_rows
+        self.is_sample = (tables.nodes.flags & tskit.NODE_IS_SAMPLE) != 0
+        self.num_samples = np.sum(self.is_sample)
+        self.rec_threshold = recombination_freq_threshold
+        self.progress = progress
+
+        self.breakpoints = np.unique(
+            np.concatenate([[0, tables.sequence_length], self.left, self.right])
+        )
+        self.num_trees = len(self.breakpoints) - 1
+        # Edges entering the tree at breakpoint i are
+        # in_order[in_index[i]:in_index[i + 1]], and similarly for edges leaving
+        self.in_order = np.argsort(self.left, kind="stable")
+        self.out_order = np.argsort(self.right, kind="stable")
+        self.in_index = np.searchsorted(self.left[self.in_order], self.breakpoints)
+        self.out_index = np.searchsorted(self.right[self.out_order], self.breakpoints)
+
+    def tree_state(self, index):
+        """
+        Returns the parent array, the array of edges above each node and the
+        number of samples beneath each node in the tree at the given index.
+        """
+        position = self.breakpoints[index]
+        parent = np.full(self.num_nodes, tskit.NULL, dtype=np.int32)
+        edge_above = np.full(self.num_nodes, tskit.NULL, dtype=np.int32)
+        present = np.where((self.left <= position) & (self.right > position))[0]
+        parent[self.child[present]] = self.parent[present]
+        edge_above[self.child[present]] = present
+        num_samples = self.is_sample.astype(np.int64)
+        # Accumulate sample counts from the youngest nodes upwards
+        children = self.child[present]
+        children = children[np.argsort(self.node_time[children], kind="stable")]
+        for child in children:
+            num_samples[parent[child]] += num_samples[child]
+        return parent, edge_above, num_samples
+
+    def split_positions(self, start, stop):
+        """
+        Returns the IDs of the edges bifurcated at the left breakpoints of the
+        trees with indexes ``start`` to ``stop - 1``, along with the positions
+        at which they are bifurcated.
+        """
+        start = max(start, 1)
+        split_edges = []
+        split_positions = []
+        if start >= stop:
+            return np.array(split_edges, dtype=np.int32), np.array(split_positions)
+        before, edge_above, num_samples = self.tree_state(start - 1)
+        after = before.copy()
+        last_split = np.full(self.num_nodes, -1)
+        time = self.node_time
+        for index in tqdm(
+            range(start, stop),
+            desc="Brick tree sequence: iterate over trees",
+            disable=not self.progress,
+        ):
+            position = self.breakpoints[index]
+            out_start, out_stop = self.out_index[index], self.out_index[index + 1]
+            in_start, in_stop = self.in_index[index], self.in_index[index + 1]
+            edges_out = self.out_order[out_start:out_stop]
+            edges_in = self.in_order[in_start:in_stop]
+
+            # Update the after tree and its sample counts
+            for edge in edges_out:
+                child = self.child[edge]
+                node = self.parent[edge]
+                while node != tskit.NULL:
+                    num_samples[node] -= num_samples[child]
+                    node = after[node]
+                after[child] = tskit.NULL
+                edge_above[child] = tskit.NULL
+            for edge in edges_in:
+                child = self.child[edge]
+                after[child] = self.parent[edge]
+                edge_above[child] = edge
+                node = self.parent[edge]
+                while node != tskit.NULL:
+                    num_samples[node] += num_samples[child]
+                    node = after[node]
+
+            # Bifurcate edges which persist across the breakpoint on the paths
+            # from each new edge to where the before and after trees coalesce
+            for edge in edges_in:
+                child = self.child[edge]
+                if num_samples[child] / self.num_samples <= self.rec_threshold:
+                    continue
+                right = self.parent[edge]
+                left = before[child]
+                while right != left and right != tskit.NULL and left != tskit.NULL:
+                    if time[right] <= time[left]:
+                        node = right
+                        right = after[right]
+                    else:
+                        node = left
+                        left = before[left]
+                    above = edge_above[node]
+                    if (
+                        above != tskit.NULL
+                        and self.left[above] < position
+                        and last_split[node] != index
+                    ):
+                        split_edges.append(above)
+                        split_positions.append(position)
+                        last_split[node] = index
+
+            # Update the before tree to match the after tree
+            for edge in edges_out:
+                before[self.child[edge]] = tskit.NULL
+            for edge in edges_in:
+                before[self.child[edge]] = self.parent[edge]
+
+        return np.array(split_edges, dtype=np.int32), np.array(split_positions)
+
+    def bricked_edges(self, split_edges, split_positions):
+        """
+        Returns the left, right, parent and child columns of the edge table
+        created by bifurcating edges at the given positions.
+        """
+        edge_ids = np.concatenate([np.arange(len(self.left)), split_edges])
+        left = np.concatenate([self.left, split_positions])
+        order = np.lexsort((left, edge_ids))
+        edge_ids = edge_ids[order]
+        left = left[order]
+        # Each brick ends where the next brick from the same edge starts, or at
+        # the right of the edge if it is the last brick
+        right = np.empty_like(left)
+        right[:-1] = left[1:]
+        last = np.ones(len(edge_ids), dtype=bool)
+        last[:-1] = edge_ids[1:] != edge_ids[:-1]
+        right[last] = self.right[edge_ids[last]]
+        return left, right, self.parent[edge_ids], self.child[edge_ids]
+
+
+_splitter = None
+
+
+def init_split_worker(splitter):
+    """
+    Pool initializer, which gives each worker process its own copy of the
+    EdgeSplitter.
+    """
+    global _splitter
+    _splitter = splitter
+
+
+def split_interval(interval):
+    """
+    Function passed to the multiprocessing object to find the bifurcations in
+    a tree-aligned interval. Takes a tuple of the first and one past the last
+    tree index in the interval.
+    """
+    return _splitter.split_positions(interval[0], interval[1])
+
+
 class Bricks:
     def __init__(
         self,
         ts,
         recombination_freq_threshold=None,
         progress=True,
+        num_processes=1,
     ):
         self.ts = ts
         if recombination_freq_threshold is None:
             recombination_freq_threshold = 0
         self.rec_threshold = recombination_freq_threshold
         self.progress = progress
+        self.num_processes = num_processes
+
+    def tree_intervals(self, splitter):
+        """
+        Split the trees after the first into ``num_processes`` contiguous
+        intervals with roughly equal numbers of incoming edges. Returns a list of
+        (start, stop) tree indexes.
+        """
+        edges_in = np.cumsum(np.diff(splitter.in_index)[1:])
+        targets = np.arange(1, self.num_processes) * edges_in[-1] / self.num_processes
+        bounds = np.concatenate(
+            [[1], np.searchsorted(edges_in, targets) + 2, [splitter.num_trees]]
+        )
+        bounds = np.unique(np.clip(bounds, 1, splitter.num_trees))
+        return list(zip(bounds[:-1], bounds[1:]))
 
     def bifurcate_edge(self, edge_child, interval, tables, current_edges):
         """
@@ -119,3 +308,49 @@ class Bricks:
         )
         new_ts = tables.tree_sequence()
         return new_ts
+
+    def split_edges(self):
+        """
+        Array-backed equivalent of :meth:`naive_split_edges`, which produces an
+        identical edge table without copying each marginal tree.
+        """
+        tables = self.ts.dump_tables()
+        splitter = EdgeSplitter(
+            tables,
+            recombination_freq_threshold=self.rec_threshold,
+            progress=self.progress,
+        )
+        if self.num_processes == 1 or splitter.num_trees <= 2:
+            split_edges, split_positions = splitter.split_positions(
+                1, splitter.num_trees
+            )
+        else:
+            # Each worker bricks a tree-aligned interval. Edges which straddle
+            # interval boundaries are stitched back together by bricked_edges(),
+            # which cuts each input edge at the split positions from every interval
+            splitter.progress = False
+            intervals = self.tree_intervals(splitter)
+            with multiprocessing.Pool(
+                processes=self.num_processes,
+                initializer=init_split_worker,
+                initargs=(splitter,),
+            ) as pool:
+                results = list(
+                    tqdm(
+                        pool.imap(split_interval, intervals),
+                        total=len(intervals),
+                        desc="Brick tree sequence: iterate over intervals",
+                        disable=not self.progress,
+                    )
+                )
+            split_edges = np.concatenate([result[0] for result in results])
+            split_positions = np.concatenate([result[1] for result in results])
+        left, right, parent, child = splitter.bricked_edges(
+            split_edges, split_positions
+        )
+        tables.edges.set_columns(left=left, right=right, parent=parent, child=child)
+        tables.sort()
+        tables.provenances.add_row(
+            record=json.dumps(utility.get_provenance_dict({"command": "brick_ts"}))
+        )
+        return tables.tree_sequence()
@@ -63,6 +63,18 @@ def ldgm_cli_parser():
         help="The maximum path threshold to retain in the linkage disequilibrium \
                 graphical model.",
     )
+    parser.add_argument(
+        "-t",
+        "--thresholds",
+        type=float,
+        nargs="+",
+        default=None,
+        help="More path thresholds at which to also create linkage disequilibrium \
+                graphical models, from a single search. The model at the \
+                path_threshold is still stored in the output file, and the model \
+                at each other threshold in the output file followed by an \
+                underscore and the threshold.",
+    )
     # parser.add_argument(
     #    "-p", "--progress", action="store_true", help="Show progress bar."
     # )
@@ -79,8 +91,18 @@ def run_make_ldgm(args):
         ts = tskit.load(args.tree_sequence)
     except tskit.FileFormatError as ffe:
         error_exit(f"Error loading '{args.tree_sequence}: {ffe}")
-    snp_graph, id_to_muts = ldgm.make_ldgm(ts, args.path_threshold)
-    nx.readwrite.edgelist.write_weighted_edgelist(snp_graph, args.output)
+    if args.thresholds is None:
+        snp_graph, id_to_muts = ldgm.make_ldgm(ts, args.path_threshold)
+        nx.readwrite.edgelist.write_weighted_edgelist(snp_graph, args.output)
+    else:
+        # Each threshold is written once, the path_threshold without a suffix
+        thresholds = list(dict.fromkeys([args.path_threshold] + args.thresholds))
+        snp_graphs, id_to_muts = ldgm.make_ldgm_sweep(ts, thresholds)
+        nx.readwrite.edgelist.write_weighted_edgelist(snp_graphs[0], args.output)
+        for threshold, snp_graph in zip(thresholds[1:], snp_graphs[1:]):
+            nx.readwrite.edgelist.write_weighted_edgelist(
+                snp_graph, f"{args.output}_{threshold:g}"
+            )
 
 
 def ldgm_main(arg_list=None):
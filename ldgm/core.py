@@ -1,16 +1,21 @@
 """
 Functions to produce reduced graph and intermediate steps
 """
+import concurrent.futures
+import functools
+
 import networkx as nx
-from tqdm import tqdm
+import numpy as np
 
 from . import brickhaplograph
+from . import brickindex
 from . import bricks
+from . import graph
 from . import reduction
 from . import utility
 
 
-def brick_ts(ts, recombination_freq_threshold=None, progress=True):
+def brick_ts(ts, recombination_freq_threshold=None, progress=True, num_processes=1):
     """
     Take an input tree sequence and bifurcate edges to create "bricks" that
     have the same set of descendants at every position.
@@ -26,6 +31,10 @@ def brick_ts(ts, recombination_freq_threshold=None, progress=True):
         If None, all edges with differing numbers of descendants to the left
         and right of a recombination event are bifurcated. Default: None
     :param bool progress: Whether to display a progress bar. Default: False
+    :param int num_processes: The number of processes to use. If greater than
+        one, the tree sequence is split into tree-aligned intervals which are
+        bricked in parallel. The result is identical to the sequential bricked
+        tree sequence. Default: 1
     :return: A bricked version of the input tree sequence
     :rtype: tskit.TreeSequence
     """
@@ -34,13 +43,19 @@ def brick_ts(ts, recombination_freq_threshold=None, progress=True):
         ts,
         recombination_freq_threshold=recombination_freq_threshold,
         progress=progress,
+        num_processes=num_processes,
     )
-    bricked = brick.naive_split_edges()
+    bricked = brick.split_edges()
     return bricked
 
 
 def brick_haplo_graph(
-    bricked_ts, edge_weight_threshold=None, make_sibs=True, progress=True
+    bricked_ts,
+    edge_weight_threshold=None,
+    make_sibs=True,
+    progress=True,
+    brick_index=None,
+    as_networkx=False,
 ):
     """
     Takes a "bricked" tree sequence and creates a "brick-haplotype graph". This
@@ -78,18 +93,116 @@ def brick_haplo_graph(
     :param bool make_sibs: Whether to run rule two, connecting siblings.
         Default: True
     :param bool progress: Whether to display a progress bar. Default: False
-    :return: A ``Networkx`` graph encoding conditional dependence between
-        labeled bricks.
-    :rtype: networkx.DiGraph
+    :param brickindex.BrickIndex brick_index: The brick index of
+        ``bricked_ts``. If None, it is computed. Default: None
+    :param bool as_networkx: Whether to return a ``networkx.DiGraph``, as a
+        compatibility view for code which uses networkx methods. If False, the
+        array-backed :class:`graph.CSRGraph` is returned. Default: False
+    :return: A graph encoding conditional dependence between labeled bricks.
+    :rtype: networkx.DiGraph or graph.CSRGraph
     """
     assert utility.check_bricked(bricked_ts) is True
     brick_grapher = brickhaplograph.BrickHaploGraph(
-        bricked_ts, edge_weight_threshold, make_sibs=make_sibs, progress=progress
+        bricked_ts,
+        edge_weight_threshold,
+        make_sibs=make_sibs,
+        progress=progress,
+        brick_index=brick_index,
     )
     bricked_graph = brick_grapher.make_brick_graph()
+    if as_networkx:
+        bricked_graph = bricked_graph.to_networkx()
     return bricked_graph
 
 
+def brick_haplo_graphs(
+    bricked_ts,
+    edge_weight_threshold=None,
+    progress=True,
+    brick_index=None,
+    as_networkx=False,
+):
+    """
+    Creates the brick-haplotype graphs without and with rule two (see
+    ``ldgm.brick_haplo_graph()``) in a single pass over the bricked tree sequence.
+    The graph without rule two is a filtered copy of the edges of the graph
+    with rule two.
+
+    :param tskit.TreeSequence bricked_ts: The input :class:`tskit.TreeSequence`, which
+        has been bricked (i.e. ``ldgm.brick_ts()`` has been run on it).
+    :param float edge_weight_threshold: The maximum weight of edges in the graphs.
+        Default: None
+    :param bool progress: Whether to display a progress bar. Default: True
+    :param brickindex.BrickIndex brick_index: The brick index of
+        ``bricked_ts``. If None, it is computed. Default: None
+    :param bool as_networkx: Whether to return ``networkx.DiGraph`` objects, as
+        a compatibility view for code which uses networkx methods. If False, the
+        array-backed :class:`graph.CSRGraph` objects are returned.
+        Default: False
+    :return: A tuple of the brick-haplotype graphs made with ``make_sibs=False``
+        and ``make_sibs=True``.
+    :rtype: (networkx.DiGraph, networkx.DiGraph) or (graph.CSRGraph, graph.CSRGraph)
+    """
+    assert utility.check_bricked(bricked_ts) is True
+    brick_grapher = brickhaplograph.BrickHaploGraph(
+        bricked_ts,
+        edge_weight_threshold,
+        make_sibs=True,
+        progress=progress,
+        brick_index=brick_index,
+    )
+    bricked_graph_rule_two = brick_grapher.make_brick_graph()
+    bricked_graph = brickhaplograph.without_sibs(bricked_graph_rule_two)
+    if as_networkx:
+        bricked_graph = bricked_graph.to_networkx()
+        bricked_graph_rule_two = bricked_graph_rule_two.to_networkx()
+    return bricked_graph, bricked_graph_rule_two
+
+
+def contract_graph(
+    brick_haplo_graph,
+    brick_ts,
+    path_weight_threshold=None,
+    brick_index=None,
+    as_networkx=False,
+):
+    """
+    Simplifies a brick-haplo graph before ``ldgm.reduce_graph()`` by eliminating
+    the vertices of unlabeled bricks which only carry paths along a chain (or
+    lead nowhere), replacing them by edges weighted by the lengths of these
+    paths. The lengths of the shortest paths between the vertices of labeled
+    bricks and haplotypes, up to ``path_weight_threshold``, are unchanged, so
+    the reduced graph is the same.
+
+    :param networkx.DiGraph brick_haplo_graph: An input brick-haplo graph,
+        outputted by `ldgm.brick_haplo_graph()`, either as a ``networkx.DiGraph``
+        or a :class:`graph.CSRGraph`.
+    :param tskit.TreeSequence brick_ts: The bricked :class:`tskit.TreeSequence`
+        which was passed to `ldgm.brick_haplo_graph()`.
+    :param float path_weight_threshold: The maximum path weight which will be
+        used by ``ldgm.reduce_graph()``. Longer paths may be dropped. If None,
+        all path lengths are preserved. Default: None
+    :param brickindex.BrickIndex brick_index: The brick index of ``brick_ts``.
+        If None, it is computed. Default: None
+    :param bool as_networkx: Whether to return a ``networkx.DiGraph``, as a
+        compatibility view for code which uses networkx methods. If False, a
+        :class:`graph.CSRGraph` is returned. Default: False
+    :return: The contracted brick-haplo graph
+    :rtype: networkx.DiGraph or graph.CSRGraph
+    """
+    if brick_index is None:
+        brick_index = brickindex.BrickIndex.from_ts(brick_ts)
+    if isinstance(brick_haplo_graph, nx.DiGraph):
+        brick_haplo_graph = graph.CSRGraph.from_networkx(brick_haplo_graph)
+    keep = brickhaplograph.reduced_vertices(
+        brick_index.labeled, brick_haplo_graph.num_vertices
+    )
+    contracted = brick_haplo_graph.contract(keep, cutoff=path_weight_threshold)
+    if as_networkx:
+        contracted = contracted.to_networkx()
+    return contracted
+
+
 def reduce_graph(
     brick_haplo_graph,
     brick_ts,
@@ -97,12 +210,18 @@ def reduce_graph(
     num_processes=1,
     progress=True,
     chunksize=100,
+    brick_index=None,
+    backend="dijkstra",
+    epsilon=1e-3,
+    as_networkx=False,
+    window_size=None,
 ):
     """
     Make a reduced graph from a brick-haplo graph and bricked tree sequence
 
     :param networkx.DiGraph brick_haplo_graph: An input brick-haplo graph,
-        outputted by `ldgm.brick_haplo_graph()`.
+        outputted by `ldgm.brick_haplo_graph()`, either as a ``networkx.DiGraph``
+        or a :class:`graph.CSRGraph`.
     :param tskit.TreeSequence brick_ts: The input :class:`tskit.TreeSequence`, which
         has been bricked (i.e. ``ldgm.brick_ts()`` has been run on it). This
         must be the tree sequence which was passed to `ldgm.brick_haplo_graph()`.
@@ -113,8 +232,32 @@ def reduce_graph(
         weights. Values of 4-6 have led to good results with data from the
         1000 Genomes Project.
     :param bool progress: Whether to display a progress bar. Default: False
+    :param brickindex.BrickIndex brick_index: The brick index of ``brick_ts``.
+        If None, it is computed. Default: None
+    :param str backend: The shortest path search used to find reach sets, one of
+        "dijkstra", "networkx" (the slow reference implementation), "scipy"
+        (which requires scipy), "dial" (approximate, with weights rounded to
+        multiples of ``epsilon``) or "tree" (all the reach sets in a single
+        pass, which does not use ``num_processes``, for graphs without rule
+        two). See :class:`search.ReachSearch`.
+        Default: "dijkstra"
+    :param float epsilon: The resolution of edge weights in the "dial" backend.
+        Path weights are exact to within epsilon / 2 per edge of the path. The
+        search from each out node steps through up to
+        ``path_weight_threshold`` / epsilon buckets, so larger values are
+        faster: with thresholds of 4-6, 1e-2 is faster than "dijkstra" while
+        1e-3 is not. Default: 1e-3
+    :param bool as_networkx: Whether to return a ``networkx.DiGraph``. If False,
+        a :class:`reduction.ReducedGraph`, which holds the path weights in a
+        sparse matrix, is returned. Default: False
+    :param float window_size: If not None and using multiple processes, the
+        out nodes are split into genomic windows of this many base pairs, and
+        each process is only sent the part of the brick-haplo graph within
+        ``path_weight_threshold`` of a window, which bounds its memory use by
+        the window size. Otherwise, processes share a single copy of the whole
+        graph. Default: None
     :return: An LDGM
-    :rtype: networkx.DiGraph
+    :rtype: networkx.DiGraph or reduction.ReducedGraph
     """
     assert utility.check_bricked(brick_ts)
     snp_grapher = reduction.SNP_Graph(
@@ -124,8 +267,14 @@ def reduce_graph(
         num_processes=num_processes,
         progress=progress,
         chunksize=chunksize,
+        brick_index=brick_index,
+        backend=backend,
+        epsilon=epsilon,
+        window_size=window_size,
     )
     reduced_graph = snp_grapher.create_reduced_graph()
+    if as_networkx:
+        reduced_graph = reduced_graph.to_networkx()
     return reduced_graph
 
 
@@ -136,6 +285,9 @@ def make_ldgm(
     num_processes=1,
     chunksize=100,
     progress=False,
+    backend="dijkstra",
+    epsilon=1e-3,
+    window_size=None,
 ):
     """
     Take a tree sequence and produce an LDGM. The ``path_weight_threshold`` and
@@ -159,72 +311,312 @@ def make_ldgm(
         the edge's child node is greater than 1% in the right hand marginal tree.
         If None, all edges with differing numbers of descendants to the left
         and right of a recombination event are bifurcated. Default: None
-    :param int num_processes: The number of threads to use. Default: 1
+    :param int num_processes: The number of threads to use. If greater than
+        one, the brick-haplo graphs without and with rule two are searched at
+        the same time. With more than two, the processes are split between them
+        by the estimated cost of each search, from the reach sets of 64 out
+        nodes of each graph (see ``reduction.search_cost()``), which takes
+        about the time of searching from 128 out nodes. Default: 1
     :param int chunksize: If using multiple threads, the algorithm will chop
         the dijkstra search step (the rate-limiting step of the algorithm)
         into chunks of nodes. The ``chunksize`` parameter determines the
-        approximate size of chunks. Good results were observed with values
-        around 100. Default: 100
+        maximum size of chunks, which shrink towards the end of the run to
+        balance the load between processes. Good results were observed with
+        values around 100. Default: 100
     :param bool progress: Whether to display a progress bar. Default: False
+    :param str backend: The shortest path search used to find reach sets, see
+        ``ldgm.reduce_graph()``. The "tree" backend is only used for the
+        brick-haplo graph without rule two, and the graph with rule two is
+        searched with "dijkstra". Default: "dijkstra"
+    :param float epsilon: The resolution of edge weights in the "dial" backend,
+        see ``ldgm.reduce_graph()``. Default: 1e-3
+    :param float window_size: The size in base pairs of the genomic windows
+        sent to each process, see ``ldgm.reduce_graph()``. Default: None
     :return: A tuple of an LDGM and a bricked tree sequence.
     :rtype: (networkx.DiGraph, tskit.TreeSequence)
     """
+    ldgms, bts = make_ldgm_sweep(
+        ts,
+        [path_weight_threshold],
+        recombination_freq_threshold=recombination_freq_threshold,
+        num_processes=num_processes,
+        chunksize=chunksize,
+        progress=progress,
+        backend=backend,
+        epsilon=epsilon,
+        window_size=window_size,
+    )
+    return (ldgms[0], bts)
+
+
+def make_ldgm_sweep(
+    ts,
+    thresholds,
+    recombination_freq_threshold=None,
+    num_processes=1,
+    chunksize=100,
+    progress=False,
+    backend="dijkstra",
+    epsilon=1e-3,
+    window_size=None,
+):
+    """
+    Take a tree sequence and produce an LDGM at each of several path weight
+    thresholds, as ``ldgm.make_ldgm()`` would with each threshold. The tree
+    sequence is bricked once, and the brick-haplo graphs are searched at the
+    largest threshold: the reach sets up to that threshold give the reduced
+    graphs at each of the smaller thresholds, except for the few out nodes
+    whose reach sets differ in the brick-haplo graph with rule two at a smaller
+    threshold, which are searched again. Haplotypes are only eliminated again
+    for thresholds with different reduced graphs.
+
+    :param tskit.TreeSequence tree_sequence: The input :class:`tskit.TreeSequence`,
+        which will be used to create the linkage disequilibrium graphical
+        models.
+    :param list thresholds: The path weight thresholds (see the
+        ``path_weight_threshold`` of ``ldgm.make_ldgm()``) of the LDGMs.
+    :param float recombination_freq_threshold: The minimum frequency above which
+        bricks should be created by "bifurcating" edges, see
+        ``ldgm.make_ldgm()``. Default: None
+    :param int num_processes: The number of threads to use, split between the
+        brick-haplo graphs without and with rule two as in
+        ``ldgm.make_ldgm()``. Default: 1
+    :param int chunksize: The maximum number of nodes in the chunks of the
+        search sent to each process, see ``ldgm.make_ldgm()``. Default: 100
+    :param bool progress: Whether to display a progress bar. Default: False
+    :param str backend: The shortest path search used to find reach sets, see
+        ``ldgm.reduce_graph()``. The "tree" backend is only used for the
+        brick-haplo graph without rule two, and the graph with rule two is
+        searched with "dijkstra". Default: "dijkstra"
+    :param float epsilon: The resolution of edge weights in the "dial" backend,
+        see ``ldgm.reduce_graph()``. Default: 1e-3
+    :param float window_size: The size in base pairs of the genomic windows
+        sent to each process, see ``ldgm.reduce_graph()``. Default: None
+    :return: A tuple of a list of the LDGMs at each threshold, in the order of
+        ``thresholds``, and a bricked tree sequence.
+    :rtype: (list, tskit.TreeSequence)
+    """
+    # Each distinct threshold is handled once, from the largest down
+    distinct = sorted(set(thresholds), key=_cutoff, reverse=True)
     # Step 1: brick ts
     bts = brick_ts(
-        ts, recombination_freq_threshold=recombination_freq_threshold, progress=progress
+        ts,
+        recombination_freq_threshold=recombination_freq_threshold,
+        progress=progress,
+        num_processes=num_processes,
     )
-    # Step 2: is brickhaplograph with no rule two or uturns
-    bricked_graph = brick_haplo_graph(
+    # A single index of the bricks is shared by every step
+    brick_index = brickindex.BrickIndex.from_ts(bts, progress=progress)
+    # Steps 2 and 4: brickhaplographs without and with rule two and uturns,
+    # built in a single pass at the largest threshold. The graphs at each
+    # smaller threshold are only made when they are searched, without rule two
+    # by filtering the edges, and with rule two, which is not a filter of the
+    # graph at the largest threshold, by building it again
+    brick_graphs = brick_haplo_graphs(
         bts,
-        path_weight_threshold,
+        distinct[0],
         progress=progress,
-        make_sibs=False,
+        brick_index=brick_index,
+        as_networkx=False,
     )
-    # Step 3: compute reach* and create SNP-haplo graph
-    H1 = reduce_graph(
-        bricked_graph,
-        bts,
-        path_weight_threshold=path_weight_threshold,
-        num_processes=num_processes,
+    smaller_graphs = [
+        functools.partial(_filter_graph, brick_graphs[0]),
+        functools.partial(
+            brick_haplo_graph,
+            bts,
+            make_sibs=True,
+            progress=progress,
+            brick_index=brick_index,
+            as_networkx=False,
+        ),
+    ]
+    # Steps 3 and 5: compute reach* and create the SNP-haplo graphs of the
+    # brickhaplographs without and with rule two, at every threshold
+    reduce_options = dict(
         chunksize=chunksize,
         progress=progress,
+        epsilon=epsilon,
+        window_size=window_size,
     )
-    # Step 4: brickhaplograph with rule two and uturns
-    brickhaplograph_rule_two = brick_haplo_graph(
-        bts, path_weight_threshold, make_sibs=True, progress=progress
-    )
-    # Step 5: reduce brickhaplograph created with rule two
-    H2 = reduce_graph(
-        brickhaplograph_rule_two,
-        bts,
-        path_weight_threshold=path_weight_threshold,
-        num_processes=num_processes,
-        progress=progress,
-        chunksize=chunksize,
+    # The tree backend only searches the graph without rule two: the pass over
+    # the graph with rule two merges the reach sets of whole sibling sets into
+    # each of their vertices, which is slower than searching from each out node
+    backends = [backend, "dijkstra" if backend == "tree" else backend]
+    if num_processes > 1:
+        # H1 and H2 are computed at the same time, H2 in another process, and
+        # the processes are split between them by the estimated search costs.
+        # With two processes, each search has one either way
+        rule_two_processes = 1
+        if num_processes > 2:
+            costs = [
+                reduction.search_cost(brick_graph, _cutoff(distinct[0]))
+                for brick_graph in brick_graphs
+            ]
+            rule_two_processes = round(num_processes * costs[1] / max(sum(costs), 1))
+            rule_two_processes = min(max(rule_two_processes, 1), num_processes - 1)
+        with concurrent.futures.ProcessPoolExecutor(1) as executor:
+            future = executor.submit(
+                _reduce_graphs,
+                brick_graphs[1],
+                smaller_graphs[1],
+                bts,
+                distinct,
+                brick_index,
+                num_processes=rule_two_processes,
+                backend=backends[1],
+                **reduce_options,
+            )
+            H1 = _reduce_graphs(
+                brick_graphs[0],
+                smaller_graphs[0],
+                bts,
+                distinct,
+                brick_index,
+                num_processes=num_processes - rule_two_processes,
+                backend=backends[0],
+                **reduce_options,
+            )
+            H2 = future.result()
+    else:
+        H1, H2 = (
+            _reduce_graphs(
+                brick_graph,
+                smaller_graph,
+                bts,
+                distinct,
+                brick_index,
+                num_processes=num_processes,
+                backend=graph_backend,
+                **reduce_options,
+            )
+            for brick_graph, smaller_graph, graph_backend in zip(
+                brick_graphs, smaller_graphs, backends
+            )
+        )
+    del brick_graphs, smaller_graphs
+    # The reduced graphs at each threshold
+    H1, H2 = (dict(zip(distinct, reduced_graphs)) for reduced_graphs in [H1, H2])
+    ldgms = {}
+    previous = None
+    # From the largest threshold down, so that thresholds with the same H_12 can
+    # filter the edges of the larger threshold's reduced H_12
+    for threshold in distinct:
+        # Step 6: combine H1 and H2, keeping the minimum weight of edges in more
+        # than one of H1, its reverse and H2
+        H_12 = reduction.ReducedGraph.compose(
+            [H1[threshold], H1[threshold].reverse(), H2[threshold]]
+        )
+        del H1[threshold], H2[threshold]
+        # Step 7: Remove haplotype vertices to reduce H_12, in batches which are
+        # split between the processes
+        if previous is not None and previous[0].equals(H_12):
+            H_12_reduced = previous[1].filter_weights(_cutoff(threshold))
+        else:
+            H_12_reduced = H_12.eliminate_haplotypes(threshold, num_processes)
+        previous = H_12, H_12_reduced
+        # Symmetrize, keeping the minimum weight of the two directions, and
+        # relabel the nodes by their LDGM IDs. The edges of each node which were
+        # in H_12 come before the edges through haplotypes
+        node_ids = brick_index.ldgm_ids[brick_index.mut_bricks[H_12_reduced.nodes]]
+        ldgms[threshold] = H_12_reduced.to_undirected_networkx(
+            node_ids=node_ids, first=H_12
+        )
+    # A threshold given more than once has a copy of the LDGM for each
+    ldgm_list = []
+    for index, threshold in enumerate(thresholds):
+        ldgm_graph = ldgms[threshold]
+        if threshold in thresholds[:index]:
+            ldgm_graph = ldgm_graph.copy()
+        ldgm_list.append(ldgm_graph)
+
+    return (ldgm_list, bts)
+
+
+def _reduce_graphs(
+    brick_graph, smaller_graph, brick_ts, thresholds, brick_index, **kwargs
+):
+    """
+    Returns the reduced graphs (as reduction.ReducedGraph) of the brick-haplo
+    graphs at each of ``thresholds``, largest first, where ``brick_graph`` is
+    the graph at the largest threshold and ``smaller_graph(threshold)`` makes
+    the graph at a smaller threshold. The reach sets in ``brick_graph`` give
+    the reduced graphs at every threshold, from a single search, except for the
+    out nodes whose reach sets may differ in the graph at a smaller threshold,
+    which are searched again in that graph. The graphs at smaller thresholds
+    are made one at a time. Other keyword arguments are passed to
+    reduction.SNP_Graph.
+    """
+
+    def reduced_graphs(brick_graph, threshold, **options):
+        # Eliminate the vertices of unlabeled bricks which only pass paths along
+        brick_graph = contract_graph(
+            brick_graph,
+            brick_ts,
+            path_weight_threshold=threshold,
+            brick_index=brick_index,
+            as_networkx=False,
+        )
+        return reduction.SNP_Graph(
+            brick_graph,
+            brick_ts,
+            threshold,
+            brick_index=brick_index,
+            **options,
+            **kwargs,
+        ).create_reduced_graph()
+
+    affected = [np.zeros(0, dtype=np.int64)]
+    searched = [None]
+    for threshold in thresholds[1:]:
+        threshold_graph = smaller_graph(threshold)
+        out_nodes = reduction.affected_out_nodes(
+            brick_graph, threshold_graph, _cutoff(threshold)
+        )
+        affected.append(out_nodes)
+        searched.append(
+            reduced_graphs(threshold_graph, threshold, out_nodes=out_nodes)
+            if len(out_nodes) > 0
+            else None
+        )
+        del threshold_graph
+
+    reduced = reduced_graphs(
+        brick_graph,
+        thresholds[0],
+        thresholds=[_cutoff(threshold) for threshold in thresholds],
+        skipped=affected,
     )
-    # Step 6: combine H1 and H2
-    H_12 = nx.compose_all([H1, nx.reverse(H1), H2])
-    # Step 7: Remove haplotype vertices to reduce H_12
-    H_12_reduced = H_12.copy()
-    nodes = list(H_12_reduced.nodes())
-    for node in tqdm(nodes, total=len(nodes), desc="Removing nodes"):
-        if node < 0:
-            H_12_reduced = utility.remove_node(
-                H_12_reduced,
-                node,
-                path_weight_threshold,
+    for index, searched_graph in enumerate(searched):
+        if searched_graph is not None:
+            composed = reduction.ReducedGraph.compose([reduced[index], searched_graph])
+            # The graph at the smaller threshold may have fewer labeled out
+            # nodes, such as none at all at a threshold of 0
+            reduced[index] = reduction.ReducedGraph(
+                searched_graph.nodes, composed.matrix, composed.offset
             )
-    H_12_reduced = H_12_reduced.to_undirected()
-    H_12_reduced_relabeled = utility.convert_node_ids(H_12_reduced, bts)
+    return reduced
+
+
+def _filter_graph(brick_graph, threshold):
+    """
+    The brick-haplo graph without rule two at a smaller threshold, which is
+    ``brick_graph`` without the edges of weight at least the threshold
+    """
+    return brick_graph.filter_edges(brick_graph.weights < _cutoff(threshold))
 
-    return (H_12_reduced_relabeled, bts)
+
+def _cutoff(threshold):
+    """
+    The path weight threshold as a number, where None keeps paths of any weight
+    """
+    return np.inf if threshold is None else threshold
 
 
 def prune_sites(ts, threshold):
     return utility.prune_sites(ts, threshold)
 
 
-def make_snplist(ts, site_metadata_id=None, population_dict=None):
+def make_snplist(ts, site_metadata_id=None, population_dict=None, brick_index=None):
     """
     Returns information on variant sites in the input
         :class:`tskit.TreeSequence`.
@@ -239,6 +631,9 @@ def make_snplist(ts, site_metadata_id=None, population_dict=None):
         ids and values are lists of nodes in each population. This defines
         populations from which allele frequencies are computed. If None,
         does not return site frequencies. Default: None.
+    :param brickindex.BrickIndex brick_index: The brick index of ``bricked_ts``,
+        which is reused to find the brick of each site. If None, it is
+        computed. Default: None
     :return: A dictionary containing the following key, value pairs:
         key: "index", value: a numpy.ndarray of the IDs of the
         node in the LDGM to which each site belongs. When multiple
@@ -257,7 +652,10 @@ def make_snplist(ts, site_metadata_id=None, population_dict=None):
     :rtype: dict
     """
     return utility.make_snplist(
-        ts, site_metadata_id=site_metadata_id, population_dict=population_dict
+        ts,
+        site_metadata_id=site_metadata_id,
+        population_dict=population_dict,
+        brick_index=brick_index,
     )
 
 
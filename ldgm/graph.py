@@ -0,0 +1,546 @@
+"""
+Array-backed weighted directed graphs
+"""
+import multiprocessing
+from multiprocessing import shared_memory
+
+import networkx as nx
+import numpy as np
+
+
+class GraphBuilder:
+    """
+    Accumulates weighted directed edges as (src, dst, weight) in growable typed
+    numpy buffers, which are finalized into a CSRGraph. If the same edge is added
+    more than once, the minimum weight is kept. Vertex IDs must fit in an int32.
+    Each edge also carries a small integer tag, such as the rule which created
+    it, so that subsets of the edges can be selected from the finalized graph.
+    """
+
+    def __init__(self, capacity=1024):
+        self.src = np.empty(capacity, dtype=np.int32)
+        self.dst = np.empty(capacity, dtype=np.int32)
+        self.weight = np.empty(capacity, dtype=np.float64)
+        self.tag = np.empty(capacity, dtype=np.int8)
+        self.num_edges = 0
+
+    def reserve(self, num_new_edges):
+        """
+        Grow the buffers, if necessary, so that they can hold another
+        ``num_new_edges`` edges.
+        """
+        required = self.num_edges + num_new_edges
+        capacity = len(self.src)
+        if required > capacity:
+            capacity = max(required, 2 * capacity)
+            num_edges = self.num_edges
+            for name in ["src", "dst", "weight", "tag"]:
+                old = getattr(self, name)
+                new = np.empty(capacity, dtype=old.dtype)
+                new[:num_edges] = old[:num_edges]
+                setattr(self, name, new)
+
+    def add_edge(self, src, dst, weight, tag=0):
+        self.reserve(1)
+        self.src[self.num_edges] = src
+        self.dst[self.num_edges] = dst
+        self.weight[self.num_edges] = weight
+        self.tag[self.num_edges] = tag
+        self.num_edges += 1
+
+    def add_edges(self, src, dst, weight, tag=0):
+        """
+        Add a batch of edges. ``weight`` and ``tag`` may be arrays or single
+        values.
+        """
+        src = np.asarray(src)
+        num_new_edges = len(src)
+        self.reserve(num_new_edges)
+        start = self.num_edges
+        stop = start + num_new_edges
+        self.src[start:stop] = src
+        self.dst[start:stop] = dst
+        self.weight[start:stop] = weight
+        self.tag[start:stop] = tag
+        self.num_edges = stop
+
+    def edges(self):
+        """
+        Returns views of the source, destination, weight and tag of the edges
+        added so far.
+        """
+        num_edges = self.num_edges
+        return (
+            self.src[:num_edges],
+            self.dst[:num_edges],
+            self.weight[:num_edges],
+            self.tag[:num_edges],
+        )
+
+    def finalize(self, num_vertices=None):
+        """
+        Returns a CSRGraph of the edges added so far. If ``num_vertices`` is None,
+        the graph has one more vertex than the largest vertex ID in an edge.
+        """
+        src, dst, weight, tag = self.edges()
+        return csr_from_edges(src, dst, weight, tag=tag, num_vertices=num_vertices)
+
+
+def csr_from_edges(src, dst, weight, tag=None, num_vertices=None):
+    """
+    Build a CSRGraph from arrays of edges, keeping the minimum weight (and the
+    tag of the edge with that weight) of duplicated edges.
+    """
+    if num_vertices is None:
+        num_vertices = 0
+        if len(src) > 0:
+            num_vertices = int(max(np.max(src), np.max(dst))) + 1
+    # Sort by source, then destination, then weight, so the first of each run
+    # of duplicated edges has the minimum weight
+    order = np.lexsort((weight, dst, src))
+    src = src[order]
+    dst = dst[order]
+    weight = weight[order]
+    keep = np.ones(len(src), dtype=bool)
+    keep[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+    src = src[keep]
+    if tag is not None:
+        tag = tag[order][keep]
+    indptr = np.zeros(num_vertices + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_vertices), out=indptr[1:])
+    return CSRGraph(indptr, dst[keep].astype(np.int32), weight[keep], tags=tag)
+
+
+def fill_tasks(graph, src, through, weight, num_tasks):
+    """
+    Split the paths of two edges, from each edge src -> through with the given
+    weight to each successor of through in ``graph``, into ``num_tasks`` shares
+    of about the same number of paths. Returns the arguments of fill_edges()
+    for each share, which hold only the successors of its own vertices.
+    """
+    out_degree = np.diff(graph.indptr)[through]
+    num_paths = np.cumsum(out_degree)
+    total = num_paths[-1] if len(num_paths) > 0 else 0
+    splits = np.searchsorted(
+        num_paths, total * np.arange(1, num_tasks) / num_tasks, side="right"
+    )
+    tasks = []
+    for task_src, task_through, task_weight in zip(
+        np.split(src, splits), np.split(through, splits), np.split(weight, splits)
+    ):
+        vertices, task_through = np.unique(task_through, return_inverse=True)
+        indptr = np.zeros(len(vertices) + 1, dtype=np.int64)
+        np.cumsum(np.diff(graph.indptr)[vertices], out=indptr[1:])
+        out_edges = graph.successor_edges(vertices)
+        tasks.append(
+            (
+                task_src,
+                task_through,
+                task_weight,
+                indptr,
+                graph.indices[out_edges],
+                graph.weights[out_edges],
+            )
+        )
+    return tasks
+
+
+def fill_edges(src, through, weight, indptr, indices, weights, cutoff):
+    """
+    Returns the (src, dst, weight) arrays of the paths of two edges from each
+    edge src -> through with the given weight to each successor of through in
+    the CSR arrays (indptr, indices, weights), with the minimum weight of
+    duplicated paths. Paths which are loops or longer than ``cutoff`` are
+    dropped.
+    """
+    successors = CSRGraph(indptr, indices, weights)
+    out_degree = np.diff(indptr)[through]
+    out_edges = successors.successor_edges(through)
+    new_src = np.repeat(src, out_degree)
+    new_dst = indices[out_edges]
+    new_weight = np.repeat(weight, out_degree) + weights[out_edges]
+    new = (new_src != new_dst) & (new_weight <= cutoff)
+    return csr_from_edges(new_src[new], new_dst[new], new_weight[new]).edge_arrays()
+
+
+class CSRGraph:
+    """
+    A weighted directed graph in compressed sparse row format. The successors
+    of vertex v are indices[indptr[v]:indptr[v + 1]], in increasing order, and
+    the weights of these edges are weights[indptr[v]:indptr[v + 1]]. If not
+    None, tags holds the tag of each edge in the same order.
+    """
+
+    def __init__(self, indptr, indices, weights, tags=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.tags = tags
+
+    @property
+    def num_vertices(self):
+        return len(self.indptr) - 1
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    def successors(self, vertex):
+        """
+        Returns arrays of the successors of the given vertex and the weights of
+        the edges to them.
+        """
+        start = self.indptr[vertex]
+        stop = self.indptr[vertex + 1]
+        return self.indices[start:stop], self.weights[start:stop]
+
+    def edge_arrays(self):
+        """
+        Returns the source, destination and weight of every edge.
+        """
+        src = np.repeat(
+            np.arange(self.num_vertices, dtype=np.int32), np.diff(self.indptr)
+        )
+        return src, self.indices, self.weights
+
+    def filter_edges(self, keep):
+        """
+        Returns a CSRGraph with the same vertices and only the edges where the
+        boolean array ``keep`` is True.
+        """
+        src, _, _ = self.edge_arrays()
+        indptr = np.zeros_like(self.indptr)
+        np.cumsum(np.bincount(src[keep], minlength=self.num_vertices), out=indptr[1:])
+        tags = None if self.tags is None else self.tags[keep]
+        return CSRGraph(indptr, self.indices[keep], self.weights[keep], tags=tags)
+
+    def arrays(self):
+        """
+        Returns a dictionary of the arrays of the graph, from which it can be
+        rebuilt with ``CSRGraph.from_arrays()``.
+        """
+        arrays = {
+            "indptr": self.indptr,
+            "indices": self.indices,
+            "weights": self.weights,
+        }
+        if self.tags is not None:
+            arrays["tags"] = self.tags
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(
+            arrays["indptr"],
+            arrays["indices"],
+            arrays["weights"],
+            tags=arrays.get("tags"),
+        )
+
+    def successor_edges(self, vertices):
+        """
+        Returns the positions in ``indices`` and ``weights`` of the edges out of
+        the given array of vertices.
+        """
+        starts = self.indptr[vertices]
+        counts = self.indptr[vertices + 1] - starts
+        offsets = np.cumsum(counts) - counts
+        return np.arange(np.sum(counts)) - np.repeat(offsets - starts, counts)
+
+    def equals(self, other):
+        """
+        Whether the other CSRGraph has the same vertices and edges, with the same
+        weights.
+        """
+        return (
+            np.array_equal(self.indptr, other.indptr)
+            and np.array_equal(self.indices, other.indices)
+            and np.array_equal(self.weights, other.weights)
+        )
+
+    def has_edges(self, src, dst):
+        """
+        Returns a boolean array of whether each edge src -> dst, given by arrays
+        of vertices, is in the graph.
+        """
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        # Edges are sorted by source then destination, so their keys are sorted
+        graph_src, graph_dst, _ = self.edge_arrays()
+        keys = graph_src.astype(np.int64) * self.num_vertices + graph_dst
+        query = src * self.num_vertices + dst
+        found = np.searchsorted(keys, query)
+        present = (found < len(keys)) & (src < self.num_vertices)
+        present &= dst < self.num_vertices
+        present[present] = keys[found[present]] == query[present]
+        return present
+
+    def topological_order(self):
+        """
+        Returns the vertices with at least one edge in topological order, found
+        by repeatedly removing the vertices with no incoming edges. Raises a
+        ValueError if the graph has a cycle.
+        """
+        src, dst, _ = self.edge_arrays()
+        has_edge = np.zeros(self.num_vertices, dtype=bool)
+        has_edge[src] = True
+        has_edge[dst] = True
+        in_degree = np.bincount(dst, minlength=self.num_vertices)
+        frontier = np.flatnonzero(has_edge & (in_degree == 0))
+        order = []
+        while len(frontier) > 0:
+            order.append(frontier)
+            successors = self.indices[self.successor_edges(frontier)]
+            in_degree -= np.bincount(successors, minlength=self.num_vertices)
+            successors = np.unique(successors)
+            frontier = successors[in_degree[successors] == 0]
+        order = np.concatenate(order) if len(order) > 0 else np.zeros(0, np.int64)
+        if len(order) < np.sum(has_edge):
+            raise ValueError("Graph is not acyclic")
+        return order
+
+    def block_subgraph(self, vertices):
+        """
+        Returns the subgraph induced by a sorted array of vertices, and the
+        sorted array of the blocks of 8 vertices (the vertices of a brick or a
+        haplotype, with IDs block * 8 to block * 8 + 7) that they belong to. In
+        the subgraph, the vertices of the ith block are relabeled 8 * i to
+        8 * i + 7, so that its size only depends on the number of blocks and
+        the vertex types (ID % 8) are unchanged.
+        """
+        blocks = np.unique(vertices // 8)
+        src = np.repeat(vertices, self.indptr[vertices + 1] - self.indptr[vertices])
+        edges = self.successor_edges(vertices)
+        dst = self.indices[edges]
+        found = np.searchsorted(vertices, dst)
+        found[found == len(vertices)] = 0
+        keep = vertices[found] == dst
+        src = src[keep]
+        dst = dst[keep]
+        subgraph = csr_from_edges(
+            np.searchsorted(blocks, src // 8) * 8 + src % 8,
+            np.searchsorted(blocks, dst // 8) * 8 + dst % 8,
+            self.weights[edges][keep],
+            num_vertices=8 * len(blocks),
+        )
+        return subgraph, blocks
+
+    def contract(self, keep, cutoff=None):
+        """
+        Returns a CSRGraph with the same vertex IDs in which every vertex where
+        the boolean array ``keep`` is False has been eliminated, if it can be
+        without adding edges: a vertex with a single predecessor or a single
+        successor (such as a link in a chain, or the end of a zero weight edge)
+        is replaced by edges from each of its predecessors to each of its
+        successors, weighted by the length of the path through it. Vertices
+        with no predecessors or no successors are removed with their edges.
+
+        Vertices are eliminated in rounds of vertices which are not adjacent to
+        each other, until no more can be. Duplicated edges are only merged at
+        the end, so they may keep a few vertices which could be eliminated. The
+        shortest path lengths between the remaining vertices, and which vertices
+        each path passes through other than eliminated ones, are unchanged.
+        Edges longer than ``cutoff`` are dropped, so only path lengths up to
+        ``cutoff`` are preserved. Tags are not kept.
+        """
+        if cutoff is None:
+            cutoff = np.inf
+        num_vertices = self.num_vertices
+        src, dst, weight = self.edge_arrays()
+        within = weight <= cutoff
+        src = src[within]
+        dst = dst[within]
+        weight = weight[within]
+        # Distinct pseudo-random priorities, so that runs of adjacent vertices
+        # which could be eliminated are eliminated in few rounds
+        priority = (np.arange(num_vertices, dtype=np.int64) * 2654435761) % 2**32
+        while True:
+            in_degree = np.bincount(dst, minlength=num_vertices)
+            out_degree = np.bincount(src, minlength=num_vertices)
+            selected = (
+                ~keep
+                & (np.minimum(in_degree, out_degree) <= 1)
+                & (in_degree + out_degree > 0)
+            )
+            # Each round eliminates vertices which are not adjacent to each other,
+            # so the paths through them have a single eliminated vertex
+            both = selected[src] & selected[dst]
+            u = src[both]
+            v = dst[both]
+            selected[np.where(priority[u] > priority[v], u, v)] = False
+            if not np.any(selected):
+                break
+            into = selected[dst]
+            out_of = selected[src]
+            # The only in or out edge of each selected vertex which has one
+            single_in = np.zeros(num_vertices, dtype=np.int64)
+            single_in[dst[into]] = np.flatnonzero(into)
+            single_out = np.zeros(num_vertices, dtype=np.int64)
+            single_out[src[out_of]] = np.flatnonzero(out_of)
+            # Paths through vertices with a single predecessor
+            after = np.flatnonzero(out_of & (in_degree[src] == 1))
+            before = single_in[src[after]]
+            # Paths through the other vertices, which have a single successor
+            other_before = np.flatnonzero(
+                into & (out_degree[dst] == 1) & (in_degree[dst] != 1)
+            )
+            before = np.concatenate([before, other_before])
+            after = np.concatenate([after, single_out[dst[other_before]]])
+            new_src = src[before]
+            new_dst = dst[after]
+            new_weight = weight[before] + weight[after]
+            new = (new_weight <= cutoff) & (new_src != new_dst)
+            unchanged = ~(into | out_of)
+            src = np.concatenate([src[unchanged], new_src[new]])
+            dst = np.concatenate([dst[unchanged], new_dst[new]])
+            weight = np.concatenate([weight[unchanged], new_weight[new]])
+        return csr_from_edges(src, dst, weight, num_vertices=num_vertices)
+
+    def eliminate(self, eliminate, cutoff=None, num_processes=1):
+        """
+        Returns a CSRGraph with the same vertex IDs in which every vertex where
+        the boolean array ``eliminate`` is True has been removed, and replaced by
+        edges from each of its predecessors to each of its successors (other
+        than itself), weighted by the length of the path through it, keeping the
+        minimum weight of duplicated edges. New edges longer than ``cutoff`` are
+        dropped. This is the min-plus result of removing the vertices one at a
+        time with ``utility.remove_node()``, in any order.
+
+        Vertices are eliminated in batches of vertices which are not adjacent to
+        each other. A vertex is in a batch if it adds no more edges (in-degree
+        times out-degree) than any neighbour still to be eliminated, following
+        the minimum degree ordering, so that few edges are filled in. The edges
+        filled in by a batch are found by ``num_processes`` processes, each
+        joining a share of the paths through the batch, and are merged between
+        batches.
+        """
+        if num_processes > 1:
+            with multiprocessing.Pool(num_processes) as pool:
+                return self._eliminate(eliminate, cutoff, pool, num_processes)
+        return self._eliminate(eliminate, cutoff, None, 1)
+
+    def _eliminate(self, eliminate, cutoff, pool, num_tasks):
+        if cutoff is None:
+            cutoff = np.inf
+        num_vertices = self.num_vertices
+        priority = (np.arange(num_vertices, dtype=np.int64) * 2654435761) % 2**32
+        graph = self
+        while True:
+            src, dst, weight = graph.edge_arrays()
+            in_degree = np.bincount(dst, minlength=num_vertices)
+            out_degree = np.diff(graph.indptr)
+            selected = eliminate & (in_degree + out_degree > 0)
+            # Order by the number of edges filled in, then by priority
+            fill = in_degree.astype(np.int64) * out_degree
+            key = (fill << 32) | priority
+            both = selected[src] & selected[dst]
+            u = src[both]
+            v = dst[both]
+            selected[np.where(key[u] > key[v], u, v)] = False
+            if not np.any(selected):
+                return graph
+            # Join each edge into a selected vertex with each edge out of it
+            into = np.flatnonzero(selected[dst])
+            tasks = fill_tasks(graph, src[into], dst[into], weight[into], num_tasks)
+            if pool is None:
+                filled = [fill_edges(*task, cutoff) for task in tasks]
+            else:
+                filled = pool.starmap(fill_edges, [task + (cutoff,) for task in tasks])
+            unchanged = ~(selected[src] | selected[dst])
+            graph = csr_from_edges(
+                np.concatenate([src[unchanged]] + [edges[0] for edges in filled]),
+                np.concatenate([dst[unchanged]] + [edges[1] for edges in filled]),
+                np.concatenate([weight[unchanged]] + [edges[2] for edges in filled]),
+                num_vertices=num_vertices,
+            )
+
+    def nodes(self):
+        """
+        Returns the sorted IDs of vertices with at least one edge.
+        """
+        src, dst, _ = self.edge_arrays()
+        return np.unique(np.concatenate([src, dst]))
+
+    def to_networkx(self):
+        """
+        Returns a ``networkx.DiGraph`` view of the graph, containing the vertices
+        with at least one edge.
+        """
+        graph = nx.DiGraph()
+        src, dst, weight = self.edge_arrays()
+        graph.add_weighted_edges_from(zip(src.tolist(), dst.tolist(), weight.tolist()))
+        return graph
+
+    @classmethod
+    def from_networkx(cls, graph, num_vertices=None):
+        """
+        Build a CSRGraph from a ``networkx.DiGraph`` with non-negative integer
+        node IDs and "weight" edge attributes.
+        """
+        edges = np.array(
+            [(u, v, data["weight"]) for u, v, data in graph.edges(data=True)],
+            dtype=np.float64,
+        ).reshape(-1, 3)
+        return csr_from_edges(
+            edges[:, 0].astype(np.int32),
+            edges[:, 1].astype(np.int32),
+            edges[:, 2],
+            num_vertices=num_vertices,
+        )
+
+
+class SharedArrays:
+    """
+    Named numpy arrays held in ``multiprocessing.shared_memory`` blocks. The
+    parent process copies arrays in with ``SharedArrays.create()`` and passes
+    ``spec`` to worker processes, which call ``SharedArrays.attach(spec)`` to
+    view the same memory without copying or unpickling it. The creator must
+    call ``unlink()`` (or use it as a context manager) to free the blocks.
+    """
+
+    def __init__(self, spec, blocks):
+        self.spec = spec
+        self.blocks = blocks
+        self.arrays = {
+            name: np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+            for name, (_, shape, dtype) in spec.items()
+        }
+
+    @classmethod
+    def create(cls, arrays):
+        spec = {}
+        blocks = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            # Zero-sized shared memory blocks are not allowed
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks[name] = block
+            spec[name] = (block.name, array.shape, array.dtype.str)
+        shared = cls(spec, blocks)
+        for name, array in arrays.items():
+            shared.arrays[name][...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, spec):
+        blocks = {
+            name: shared_memory.SharedMemory(name=block_name)
+            for name, (block_name, _, _) in spec.items()
+        }
+        return cls(spec, blocks)
+
+    def close(self):
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+
+    def unlink(self):
+        self.close()
+        for block in self.blocks.values():
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.unlink()
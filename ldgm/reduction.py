@@ -1,92 +1,502 @@
 """
 Create a reduced SNP graph
 """
-import collections
+import itertools
 import multiprocessing
 
 import networkx as nx
 import numpy as np
 from tqdm import tqdm
 
-from . import utility
-
-
-def find_reach_set(params):
-    """
-    Function passed to the multiprocessing object to find the reach set of a
-    given "out" node. Takes a tuple containing the out node, the brick graph
-    the path_weight_threshold to use, and a numpy.ndarray which converts
-    the brick_haplo_id to the ldgm node ID.
-    """
-    out_node = params[0]
-    brick_graph = params[1]
-    path_weight_threshold = params[2]
-    bricks_to_muts = params[3]
-    reach_star_set = []
-    new_edges = []
-    removed_brick_graph = brick_graph.subgraph(
-        [
-            node
-            for node in brick_graph.nodes()
-            if node
-            not in [
-                out_node - 4,
-                out_node - 3,
-                out_node - 2,
-                out_node - 1,
-                out_node + 1,
-            ]
+from . import brickindex
+from . import graph
+from . import search
+
+
+def reach_star_edges(out_nodes, reach_sets, labeled, first_muts, thresholds=None):
+    """
+    Returns the edges of the reduced graph from the reach sets of a batch of
+    "out" nodes: dictionaries of the path weights from each out node to the
+    vertices within the path_weight_threshold. Takes the boolean mask of labeled
+    bricks and a numpy.ndarray which converts the brick_haplo_id to the ldgm
+    node ID. The edges are returned as arrays of their sources, destinations
+    and weights, and a boolean array of the edges between SNPs, which are in
+    the reduced graph in both directions but are only returned once.
+
+    If ``thresholds`` is not None, the reach sets hold the vertices within the
+    largest of the thresholds, and a list of the arrays of edges at each
+    threshold is returned. A vertex connects at the thresholds from its path
+    weight up to (but not including) the path weight of the after vertex which
+    reach* requires to be outside the reach set.
+    """
+    sizes = [len(reach_set) for reach_set in reach_sets]
+    total = sum(sizes)
+    vertices = np.fromiter(
+        itertools.chain.from_iterable(reach_sets), dtype=np.int64, count=total
+    )
+    weights = np.fromiter(
+        itertools.chain.from_iterable(reach_set.values() for reach_set in reach_sets),
+        dtype=np.float64,
+        count=total,
+    )
+    positions = np.repeat(np.arange(len(reach_sets), dtype=np.int64), sizes)
+    out_muts = first_muts[np.asarray(out_nodes, dtype=np.int64) // 8][positions]
+    # Keys of the (out node, vertex) pairs, to look up vertices in reach sets
+    keys = (positions << 32) | vertices
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    sorted_weights = weights[order]
+
+    def reached_weight(other_keys):
+        # The path weight of each pair, or inf if it is not in the reach set
+        found = np.searchsorted(sorted_keys, other_keys)
+        found[found == total] = 0
+        return np.where(sorted_keys[found] == other_keys, sorted_weights[found], np.inf)
+
+    brick_haplo_ids = vertices // 8
+    vertex_types = vertices % 8
+    # The path weight from which each vertex no longer connects
+    until = np.full(total, np.inf)
+    # Vertices of labeled bricks which are before nodes, when the reach set does
+    # NOT contain the after nodes for that brick
+    connects_brick = (vertex_types == 0) | (vertex_types == 2)
+    connects_brick[connects_brick] = labeled[brick_haplo_ids[connects_brick]]
+    after = keys[connects_brick] - vertex_types[connects_brick] + 1
+    until[connects_brick] = np.minimum(reached_weight(after), reached_weight(after + 2))
+    # Haplotype before nodes, when the haplotype after node is not in the reach set
+    connects_haplo = vertex_types == 6
+    until[connects_haplo] = reached_weight(keys[connects_haplo] + 1)
+
+    # Make connections from SNP to SNP (in both directions) or SNP to haplotype
+    vertex_muts = np.zeros(total, dtype=np.int64)
+    vertex_muts[connects_brick] = first_muts[brick_haplo_ids[connects_brick]]
+    # Use -brick_haplo_id - 1 to avoid haplotype and brick id collision
+    vertex_muts[connects_haplo] = -brick_haplo_ids[connects_haplo] - 1
+    candidates = connects_brick | connects_haplo
+    if thresholds is None:
+        masks = [candidates & np.isinf(until)]
+    else:
+        masks = [
+            candidates
+            & (weights <= threshold)
+            & ((until > threshold) | np.isinf(until))
+            for threshold in thresholds
         ]
+    edges = [
+        (
+            out_muts[connects],
+            vertex_muts[connects],
+            weights[connects],
+            connects_brick[connects],
+        )
+        for connects in masks
+    ]
+    if thresholds is None:
+        return edges[0]
+    return edges
+
+
+def find_reach_sets(out_nodes, reach_search, labeled, first_muts, thresholds=None):
+    """
+    Returns the arrays of the reduced graph edges found from the given "out"
+    nodes by the search.ReachSearch, or a list of them at each of
+    ``thresholds`` (see reach_star_edges()).
+    """
+    reach_sets = [reach_set for _, reach_set in reach_search.reach_sets(out_nodes)]
+    return reach_star_edges(out_nodes, reach_sets, labeled, first_muts, thresholds)
+
+
+class ReducedGraph:
+    """
+    A reduced graph held as a sparse matrix of path weights. Its nodes are the
+    first mutations of the labeled bricks (see SNP_Graph) and -brick_haplo_id - 1
+    for haplotypes, and the row and column of each node in ``matrix`` (a
+    graph.CSRGraph) is its ID plus ``offset``. Every node in ``nodes`` is in the
+    reduced graph, even if it has no edges.
+    """
+
+    def __init__(self, nodes, matrix, offset):
+        self.nodes = nodes
+        self.matrix = matrix
+        self.offset = offset
+
+    @classmethod
+    def from_builder(cls, nodes, builder, offset):
+        """
+        Returns the ReducedGraph of the edges accumulated in a graph.GraphBuilder
+        by add_reach_star_edges(), keeping the minimum weight of duplicated edges.
+        Edges tagged 1 are added in both directions.
+        """
+        src, dst, weight, tag = builder.edges()
+        both_ways = tag == 1
+        max_node = max(np.max(nodes, initial=-1), np.max(dst, initial=-1))
+        matrix = graph.csr_from_edges(
+            np.concatenate([src, dst[both_ways]]) + offset,
+            np.concatenate([dst, src[both_ways]]) + offset,
+            np.concatenate([weight, weight[both_ways]]),
+            num_vertices=offset + int(max_node) + 1,
+        )
+        return cls(nodes, matrix, offset)
+
+    @classmethod
+    def from_networkx(cls, reduced_graph, offset):
+        """
+        Returns the ReducedGraph of a ``networkx.DiGraph`` reduced graph with
+        haplotype node IDs down to -offset. Its SNP nodes keep their order.
+        """
+        nodes = np.array(list(reduced_graph.nodes()), dtype=np.int64)
+        edges = np.array(
+            [(u, v, weight) for u, v, weight in reduced_graph.edges(data="weight")],
+            dtype=np.float64,
+        ).reshape(-1, 3)
+        matrix = graph.csr_from_edges(
+            edges[:, 0].astype(np.int32) + offset,
+            edges[:, 1].astype(np.int32) + offset,
+            edges[:, 2],
+            num_vertices=offset + int(np.max(nodes, initial=-1)) + 1,
+        )
+        return cls(nodes[nodes >= 0], matrix, offset)
+
+    @classmethod
+    def compose(cls, reduced_graphs):
+        """
+        Returns the ReducedGraph with the nodes and edges of every one of
+        ``reduced_graphs``, keeping the minimum weight of edges in more than
+        one. Its nodes are those of the first graph followed by any new nodes of
+        the others, in order.
+        """
+        offset = reduced_graphs[0].offset
+        nodes = np.concatenate(
+            [reduced_graph.nodes for reduced_graph in reduced_graphs]
+        )
+        _, first = np.unique(nodes, return_index=True)
+        edges = [reduced_graph.matrix.edge_arrays() for reduced_graph in reduced_graphs]
+        matrix = graph.csr_from_edges(
+            *(np.concatenate(arrays) for arrays in zip(*edges)),
+            num_vertices=max(
+                reduced_graph.matrix.num_vertices for reduced_graph in reduced_graphs
+            ),
+        )
+        return cls(nodes[np.sort(first)], matrix, offset)
+
+    def reverse(self):
+        """
+        Returns the ReducedGraph with the direction of every edge reversed.
+        """
+        src, dst, weight = self.matrix.edge_arrays()
+        matrix = graph.csr_from_edges(
+            dst, src, weight, num_vertices=self.matrix.num_vertices
+        )
+        return ReducedGraph(self.nodes, matrix, self.offset)
+
+    def eliminate_haplotypes(self, path_weight_threshold, num_processes=1):
+        """
+        Returns the ReducedGraph without haplotype nodes, in which each path
+        through haplotypes of weight up to path_weight_threshold is replaced by
+        an edge (see graph.CSRGraph.eliminate()).
+        """
+        haplotypes = np.arange(self.matrix.num_vertices) < self.offset
+        matrix = self.matrix.eliminate(
+            haplotypes, cutoff=path_weight_threshold, num_processes=num_processes
+        )
+        return ReducedGraph(self.nodes, matrix, self.offset)
+
+    def filter_weights(self, path_weight_threshold):
+        """
+        Returns the ReducedGraph with only the edges of weight up to
+        path_weight_threshold.
+        """
+        matrix = self.matrix.filter_edges(self.matrix.weights <= path_weight_threshold)
+        return ReducedGraph(self.nodes, matrix, self.offset)
+
+    def equals(self, other):
+        """
+        Whether the other ReducedGraph has the same nodes and edges, with the
+        same weights.
+        """
+        return (
+            self.offset == other.offset
+            and np.array_equal(self.nodes, other.nodes)
+            and self.matrix.equals(other.matrix)
+        )
+
+    def edge_arrays(self):
+        """
+        Returns the source node, destination node and weight of every edge.
+        """
+        src, dst, weight = self.matrix.edge_arrays()
+        return src - self.offset, dst - self.offset, weight
+
+    def to_networkx(self):
+        """
+        Returns the reduced graph as a ``networkx.DiGraph``.
+        """
+        reduced_graph = nx.DiGraph()
+        reduced_graph.add_nodes_from(self.nodes.tolist())
+        src, dst, weight = self.edge_arrays()
+        reduced_graph.add_weighted_edges_from(
+            zip(src.tolist(), dst.tolist(), weight.tolist())
+        )
+        return reduced_graph
+
+    def to_undirected_networkx(self, node_ids=None, first=None):
+        """
+        Returns the reduced graph as a ``networkx.Graph``, with the minimum
+        weight of the edges in either direction between two nodes. Its nodes
+        are relabeled by the array ``node_ids``, which holds the new ID of each
+        node in ``nodes``, if it is not None.
+
+        Nodes and their edges are in the order of ``nodes``. The edges of a
+        node which are also in the ReducedGraph ``first``, in either direction,
+        come before its other edges.
+        """
+        src, dst, weight = self.matrix.edge_arrays()
+        position = np.full(self.matrix.num_vertices, len(self.nodes), dtype=np.int64)
+        position[self.nodes + self.offset] = np.arange(len(self.nodes))
+        # Each edge is kept in the direction from the earlier of its two nodes
+        forward = position[src] < position[dst]
+        u = np.where(forward, src, dst)
+        v = np.where(forward, dst, src)
+        undirected = graph.csr_from_edges(
+            u, v, weight, num_vertices=self.matrix.num_vertices
+        )
+        u, v, weight = undirected.edge_arrays()
+        later = np.ones(len(u), dtype=bool)
+        if first is not None:
+            later = ~(first.matrix.has_edges(u, v) | first.matrix.has_edges(v, u))
+        order = np.lexsort((position[v], later, position[u]))
+        if node_ids is None:
+            node_ids = self.nodes
+        new_ids = np.zeros(self.matrix.num_vertices, dtype=np.int64)
+        new_ids[self.nodes + self.offset] = node_ids
+        reduced_graph = nx.Graph()
+        reduced_graph.add_nodes_from(np.asarray(node_ids).tolist())
+        reduced_graph.add_weighted_edges_from(
+            zip(
+                new_ids[u[order]].tolist(),
+                new_ids[v[order]].tolist(),
+                weight[order].tolist(),
+            )
+        )
+        return reduced_graph
+
+
+def add_reach_star_edges(builder, new_edges):
+    """
+    Add the arrays of edges returned by reach_star_edges() to a
+    graph.GraphBuilder, tagging the edges between SNPs with 1.
+    """
+    src, dst, weight, both_ways = new_edges
+    builder.add_edges(src, dst, weight, tag=both_ways)
+
+
+def out_node_costs(brick_graph, out_nodes):
+    """
+    Returns an estimate of the relative cost of searching from each of an array
+    of out nodes, from a vectorized pilot search: one plus the number of edges
+    within two steps of the out node.
+    """
+    degree = np.diff(brick_graph.indptr)
+    successors = brick_graph.indices[brick_graph.successor_edges(out_nodes)]
+    owners = np.repeat(np.arange(len(out_nodes)), degree[out_nodes])
+    two_steps = degree[out_nodes] + np.bincount(
+        owners, weights=degree[successors], minlength=len(out_nodes)
     )
-    reach_set = nx.single_source_dijkstra_path_length(
-        removed_brick_graph, out_node, cutoff=path_weight_threshold, weight="weight"
+    return 1 + two_steps
+
+
+def search_cost(brick_graph, path_weight_threshold, num_samples=64):
+    """
+    Returns an estimate of the cost of finding the reach sets of every out node
+    of a brick-haplo graph: the total size of the reach sets, extrapolated from
+    those of ``num_samples`` out nodes spread evenly over the graph.
+    """
+    vertices = brick_graph.nodes()
+    out_nodes = vertices[vertices % 8 == 4]
+    if len(out_nodes) == 0:
+        return 0
+    sample = np.unique(
+        out_nodes[np.linspace(0, len(out_nodes) - 1, num_samples).astype(int)]
+    )
+    reach_search = search.ReachSearch(brick_graph, path_weight_threshold)
+    size = sum(len(reach_set) for _, reach_set in reach_search.reach_sets(sample))
+    return size * len(out_nodes) / len(sample)
+
+
+def affected_out_nodes(brick_graph, smaller_graph, path_weight_threshold):
+    """
+    Returns the out nodes of a brick-haplo graph whose reach sets within
+    ``path_weight_threshold`` may differ in ``smaller_graph``, a brick-haplo
+    graph with a subset of its edges. These are the out nodes with a path of
+    weight at most the threshold which ends with an edge missing from
+    ``smaller_graph``, found by a search backwards from the missing edges. The
+    reach sets of every other out node are the same in both graphs.
+    """
+    below = brick_graph.filter_edges(brick_graph.weights <= path_weight_threshold)
+    src, dst, weight = below.edge_arrays()
+    missing = ~smaller_graph.has_edges(src, dst)
+    if not np.any(missing):
+        return np.zeros(0, dtype=np.int64)
+    # A new vertex is joined to the source of each missing edge, by an edge
+    # with its weight, in the reverse of the graph
+    start = below.num_vertices
+    reverse = graph.csr_from_edges(
+        np.concatenate([dst, np.full(np.sum(missing), start, dtype=dst.dtype)]),
+        np.concatenate([src, src[missing]]),
+        np.concatenate([weight, weight[missing]]),
+        num_vertices=start + 1,
+    )
+    vertices = search.reachable_vertices(reverse, [start], path_weight_threshold)
+    return vertices[(vertices % 8 == 4) & (vertices < start)]
+
+
+def schedule_out_nodes(out_nodes, costs, positions, num_processes, chunksize):
+    """
+    Splits an array of out nodes into chunks for the reduce_graph workers.
+    Chunks are runs of out nodes in order of their genomic ``positions``, so
+    that each worker searches a region of the brick graph at a time. Following
+    guided scheduling, each chunk has about 1 / (4 * num_processes) of the
+    estimated cost of the out nodes left (and at least 1 / (16 * num_processes)
+    of the total), so chunks shrink towards the end of the run and no worker is
+    left with a long tail of expensive nodes. Chunks have at most ``chunksize``
+    out nodes, which bounds the effect of underestimated costs. Returns the
+    chunks as lists, the most expensive first.
+    """
+    if len(out_nodes) == 0:
+        return []
+    order = np.argsort(positions, kind="stable")
+    out_nodes = out_nodes[order]
+    cumulative = np.cumsum(costs[order])
+    total = cumulative[-1]
+    chunks = []
+    chunk_costs = []
+    start = 0
+    done = 0
+    while start < len(out_nodes):
+        target = max((total - done) / 4, total / 16) / num_processes
+        stop = int(np.searchsorted(cumulative, done + target, side="right"))
+        stop = min(max(stop, start + 1), start + chunksize)
+        chunks.append(out_nodes[start:stop].tolist())
+        chunk_costs.append(cumulative[stop - 1] - done)
+        done = cumulative[stop - 1]
+        start = stop
+    return [chunks[i] for i in np.argsort(chunk_costs, kind="stable")[::-1]]
+
+
+# The brick graph and arrays of each reduce_graph worker process, attached to
+# shared memory by init_reach_worker()
+_worker_state = {}
+
+
+def init_reach_worker(spec, path_weight_threshold, backend, epsilon, thresholds=None):
+    """
+    Pool initializer which attaches a worker process to the brick graph and
+    arrays that SNP_Graph.create_reduced_graph() put in shared memory.
+    """
+    shared = graph.SharedArrays.attach(spec)
+    _worker_state["shared"] = shared
+    brick_graph = graph.CSRGraph.from_arrays(shared.arrays)
+    _worker_state["reach_search"] = search.ReachSearch(
+        brick_graph,
+        path_weight_threshold,
+        backend=backend,
+        epsilon=epsilon,
+        labeled=shared.arrays["labeled"],
+    )
+    _worker_state["labeled"] = shared.arrays["labeled"]
+    _worker_state["first_muts"] = shared.arrays["first_muts"]
+    _worker_state["thresholds"] = thresholds
+
+
+def find_shared_reach_sets(out_nodes):
+    """
+    Find the reduced graph edges from a chunk of out nodes in a worker process
+    set up by init_reach_worker(). Returns the number of out nodes and the
+    arrays of edges.
+    """
+    return len(out_nodes), find_reach_sets(
+        out_nodes,
+        _worker_state["reach_search"],
+        _worker_state["labeled"],
+        _worker_state["first_muts"],
+        _worker_state["thresholds"],
+    )
+
+
+def window_tasks(
+    brick_graph, out_nodes, costs, positions, window_size, path_weight_threshold
+):
+    """
+    Splits an array of out nodes into windows of ``window_size`` of their
+    genomic ``positions`` and yields a task for each window, the most expensive
+    (by the estimated ``costs`` of its out nodes) first. A task is the window's
+    out nodes and the subgraph (with the array of its blocks, see
+    graph.CSRGraph.block_subgraph()) induced by the vertices within
+    path_weight_threshold of them: the window and a halo around it, which holds
+    the reach sets of all its out nodes.
+    """
+    windows = np.floor(positions / window_size).astype(np.int64)
+    order = np.argsort(windows, kind="stable")
+    window_ids, starts = np.unique(windows[order], return_index=True)
+    window_out_nodes = np.split(out_nodes[order], starts[1:])
+    window_costs = np.split(costs[order], starts[1:])
+    by_cost = np.argsort([-np.sum(window_cost) for window_cost in window_costs])
+    for window in by_cost:
+        vertices = search.reachable_vertices(
+            brick_graph, window_out_nodes[window].tolist(), path_weight_threshold
+        )
+        subgraph, blocks = brick_graph.block_subgraph(vertices)
+        yield window_out_nodes[window], blocks, subgraph.arrays()
+
+
+def init_window_worker(
+    path_weight_threshold, backend, epsilon, labeled, first_muts, thresholds=None
+):
+    """
+    Pool initializer for reduce_graph worker processes which are sent a
+    subgraph with each task, see window_tasks().
+    """
+    _worker_state["thresholds"] = thresholds
+    _worker_state["path_weight_threshold"] = path_weight_threshold
+    _worker_state["backend"] = backend
+    _worker_state["epsilon"] = epsilon
+    _worker_state["labeled"] = labeled
+    _worker_state["first_muts"] = first_muts
+
+
+def find_window_reach_sets(task):
+    """
+    Find the reduced graph edges from the out nodes of a task made by
+    window_tasks(), in a worker process set up by init_window_worker(). Returns
+    the number of out nodes and the arrays of edges.
+    """
+    out_nodes, blocks, arrays = task
+    labeled = _worker_state["labeled"]
+    reach_search = search.ReachSearch(
+        graph.CSRGraph.from_arrays(arrays),
+        _worker_state["path_weight_threshold"],
+        backend=_worker_state["backend"],
+        epsilon=_worker_state["epsilon"],
+        labeled=labeled[np.minimum(blocks, len(labeled) - 1)],
+    )
+    # Search from the out nodes relabeled in the subgraph, and label the
+    # reached vertices back
+    subgraph_out_nodes = np.searchsorted(blocks, out_nodes // 8) * 8 + 4
+    blocks = blocks.tolist()
+    reach_sets = [
+        {
+            blocks[vertex // 8] * 8 + vertex % 8: length
+            for vertex, length in reach_set.items()
+        }
+        for _, reach_set in reach_search.reach_sets(subgraph_out_nodes.tolist())
+    ]
+    return len(out_nodes), reach_star_edges(
+        out_nodes,
+        reach_sets,
+        labeled,
+        _worker_state["first_muts"],
+        _worker_state["thresholds"],
     )
-    for vertex, weight in reach_set.items():
-        brick_haplo_id = vertex // 8
-        # that it is either labeled brick or haplotype
-        is_haplo = vertex % 8 == 6
-        # If brick id is in labeled list and not a haplotype,
-        # it's a labeled brick
-        is_labeled_brick = (
-            brick_haplo_id in list(bricks_to_muts.keys())
-        ) and not is_haplo
-        if is_labeled_brick:
-            # Make sure the vertex in the reach set is before node
-            if vertex % 8 == 0 or vertex % 8 == 2:
-                # Check that the reach set does NOT contain after nodes
-                # for that brick
-                if (brick_haplo_id * 8 + 1) not in reach_set and (
-                    brick_haplo_id * 8 + 3
-                ) not in reach_set:
-                    # Make connection from SNP to SNP or SNP to haplotype
-                    reach_star_set.append(vertex)
-                    new_edges.append(
-                        (
-                            bricks_to_muts[out_node // 8][0],
-                            bricks_to_muts[brick_haplo_id][0],
-                            weight,
-                        )
-                    )
-                    new_edges.append(
-                        (
-                            bricks_to_muts[brick_haplo_id][0],
-                            bricks_to_muts[out_node // 8][0],
-                            weight,
-                        )
-                    )
-        elif is_haplo:
-            if vertex % 8 == 6 and (brick_haplo_id * 8 + 7) not in reach_set:
-                # Use -brick_haplo_id - 1 to avoid haplotype and brick id
-                # collision
-                reach_star_set.append(vertex)
-                new_edges.append(
-                    (
-                        bricks_to_muts[out_node // 8][0],
-                        -brick_haplo_id - 1,
-                        weight,
-                    )
-                )
-    return out_node, reach_star_set, new_edges
 
 
 class SNP_Graph:
@@ -105,13 +515,10 @@ class SNP_Graph:
     (in the aforementioned brick ID indexing system). This list is in
     increasing position order, with a new index corresponding
     to the first time a brick is found.
-    The following dictionaries convert between the values
-    # Dictionary with keys = brick ids, values = list of mutation ids
-    self.bricks_to_muts = utility.get_mut_edges(brick_ts)
-    # Dictionary with keys = Brick ordered id, value = mutation on brick
-    id_to_muts = {}
-    # Dictionary with keys = Brick id, values = mutation on brick
-    bricks_to_id = {}
+    The conversions between these IDs are held in a brickindex.BrickIndex:
+    brick_index.first_muts gives the first mutation on each brick (the node ID
+    in the reduced graph) and brick_index.ldgm_ids gives the node ID of each
+    brick in the LDGM.
     """
 
     def __init__(
@@ -122,6 +529,13 @@ class SNP_Graph:
         num_processes=1,
         chunksize=100,
         progress=True,
+        brick_index=None,
+        backend="dijkstra",
+        epsilon=1e-3,
+        window_size=None,
+        thresholds=None,
+        out_nodes=None,
+        skipped=None,
     ):
         self.brick_graph = brick_graph
         self.brick_ts = brick_ts
@@ -129,70 +543,186 @@ class SNP_Graph:
         self.num_processes = num_processes
         self.chunksize = chunksize
         self.progress = progress
+        if backend not in search.BACKENDS:
+            raise ValueError(
+                f"Unknown backend {backend}, must be one of {search.BACKENDS}"
+            )
+        self.backend = backend
+        self.epsilon = epsilon
+        self.window_size = window_size
+        self.thresholds = thresholds
+        self.out_nodes = out_nodes
+        self.skipped = skipped
 
         # Tree sequence must contain mutations
         if brick_ts.num_mutations == 0:
             raise ValueError("Tree sequence must contain mutations")
 
-        # Dictionary with keys = brick ids, values = list of mutation ids
-        self.bricks_to_muts = utility.get_mut_edges(brick_ts)
-
-        # Dictionary with keys = Brick ordered id, value = mutation on brick
-        id_to_muts = {}
-        # Dictionary with keys = Brick id, values = mutation on brick
-        bricks_to_id = {}
-
-        for index, (brick, muts) in enumerate(self.bricks_to_muts.items()):
-            id_to_muts[index] = muts
-            bricks_to_id[brick] = index
-
-        # Dictionary with keys = mutation id, values = graph node id
-        self.mut_node = np.zeros(brick_ts.num_mutations)
+        if brick_index is None:
+            brick_index = brickindex.BrickIndex.from_ts(brick_ts)
+        self.brick_index = brick_index
+        if isinstance(brick_graph, nx.DiGraph):
+            self.brick_graph = graph.CSRGraph.from_networkx(brick_graph)
 
     def create_reduced_graph(self):
-        nodes = np.array(list(self.brick_graph.nodes()))
+        """
+        Returns the reduced graph as a ReducedGraph, or if ``thresholds`` is not
+        None, a list of the reduced graphs at each threshold, which are all
+        found from the reach sets within the path_weight_threshold. If
+        ``out_nodes`` is not None, only the reach sets of these out nodes are
+        searched, and if ``skipped`` is not None, the edges of its array of out
+        nodes for each threshold are left out of the reduced graph at that
+        threshold. The reduced graphs have a node for every labeled brick either
+        way.
+        """
+        nodes = self.brick_graph.nodes()
         l_out = nodes[nodes % 8 == 4]
         assert len(l_out) <= self.brick_ts.num_sites
+        # The SNP node IDs are the first mutations of the bricks, from
+        # BrickIndex.first_muts
+        snp_nodes = self.brick_index.first_muts[l_out // 8]
+        if self.out_nodes is not None:
+            l_out = np.asarray(self.out_nodes, dtype=np.int64)
 
-        # Make the reduced graph and add in all the SNPs corresponding to labeled bricks
-        R = nx.DiGraph()
-        # NOTE: The first mutation on a brick (the lowest ID) is used as the node ID
-        # in the LDGM: NOTE 08/08 NOT ANYMORE
-        # Create a new node numbering system, where
-        R.add_nodes_from([self.bricks_to_muts[node // 8][0] for node in l_out])
-
-        reach_star_sets = collections.defaultdict(list)
-        l_out_zipped = zip(
-            l_out,
-            (self.brick_graph for _ in range(len(l_out))),
-            (self.path_weight_threshold for _ in range(len(l_out))),
-            (self.bricks_to_muts for _ in range(len(l_out))),
-        )
+        # Accumulate the edges of the reduced graph (or of the reduced graph at
+        # each threshold), which has all the SNPs corresponding to labeled bricks
+        thresholds = self.thresholds
+        builders = [
+            graph.GraphBuilder(capacity=16 * len(l_out))
+            for _ in ([None] if thresholds is None else thresholds)
+        ]
+
+        labeled = self.brick_index.labeled
+        first_muts = self.brick_index.first_muts
+        # The edges of the skipped out nodes are recognised by their first
+        # mutations, the sources of their edges
+        skipped_muts = [None] * len(builders)
+        if self.skipped is not None:
+            for index, skipped_out_nodes in enumerate(self.skipped):
+                skipped_muts[index] = np.zeros(self.brick_ts.num_mutations, dtype=bool)
+                skipped_out_nodes = np.asarray(skipped_out_nodes, dtype=np.int64)
+                skipped_muts[index][first_muts[skipped_out_nodes // 8]] = True
 
-        if self.num_processes == 1:
-            for params in tqdm(
-                l_out_zipped,
+        def add_edges(new_edges):
+            if thresholds is None:
+                new_edges = [new_edges]
+            for builder, edges, skipped in zip(builders, new_edges, skipped_muts):
+                if skipped is not None:
+                    keep = ~skipped[edges[0]]
+                    edges = tuple(array[keep] for array in edges)
+                add_reach_star_edges(builder, edges)
+
+        # The tree backend finds all the reach sets in one pass, so it is not
+        # split between processes
+        if self.num_processes == 1 or self.backend == "tree":
+            reach_search = search.ReachSearch(
+                self.brick_graph,
+                self.path_weight_threshold,
+                backend=self.backend,
+                epsilon=self.epsilon,
+                labeled=labeled,
+            )
+            reach_sets = reach_search.reach_sets(l_out.tolist())
+            chunks = [
+                chunk.tolist()
+                for chunk in np.array_split(
+                    l_out, max(1, int(np.ceil(len(l_out) / self.chunksize)))
+                )
+            ]
+            with tqdm(
+                total=len(l_out),
                 disable=not self.progress,
                 desc="Reduce graph: iterate over out nodes",
-            ):
-                out_node, reach_star_set, new_edges = find_reach_set(params)
-                for new_edge in new_edges:
-                    R.add_edge(new_edge[0], new_edge[1], weight=new_edge[2])
-                reach_star_sets[out_node] = reach_star_set
+            ) as progress_bar:
+                # Find the edges of chunks of reach sets at once
+                for chunk in chunks:
+                    chunk_reach_sets = [
+                        reach_set
+                        for _, reach_set in itertools.islice(reach_sets, len(chunk))
+                    ]
+                    add_edges(
+                        reach_star_edges(
+                            chunk, chunk_reach_sets, labeled, first_muts, thresholds
+                        )
+                    )
+                    progress_bar.update(len(chunk))
 
-        else:
+        elif self.window_size is not None:
+            # Each task carries the subgraph around a genomic window of out
+            # nodes, so workers never hold the whole brick graph
+            costs = out_node_costs(self.brick_graph, l_out)
+            positions = self.brick_ts.tables.edges.left[l_out // 8]
+            tasks = window_tasks(
+                self.brick_graph,
+                l_out,
+                costs,
+                positions,
+                self.window_size,
+                self.path_weight_threshold,
+            )
+            with tqdm(
+                total=len(l_out),
+                disable=not self.progress,
+                desc="Reduce graph: iterate over out nodes",
+            ) as progress_bar:
+                with multiprocessing.Pool(
+                    processes=self.num_processes,
+                    initializer=init_window_worker,
+                    initargs=(
+                        self.path_weight_threshold,
+                        self.backend,
+                        self.epsilon,
+                        labeled,
+                        first_muts,
+                        thresholds,
+                    ),
+                ) as pool:
+                    for num_out_nodes, new_edges in pool.imap_unordered(
+                        find_window_reach_sets, tasks
+                    ):
+                        add_edges(new_edges)
+                        progress_bar.update(num_out_nodes)
 
-            with multiprocessing.Pool(processes=self.num_processes) as pool:
-                for row in tqdm(
-                    pool.imap_unordered(
-                        find_reach_set, l_out_zipped, chunksize=self.chunksize
+        else:
+            # Workers attach to a single shared copy of the brick graph, so
+            # tasks only carry chunks of out node IDs
+            arrays = self.brick_graph.arrays()
+            arrays["labeled"] = labeled
+            arrays["first_muts"] = first_muts
+            # Balance the load between workers, dispatching the expensive out
+            # nodes first, in chunks of nearby bricks
+            costs = out_node_costs(self.brick_graph, l_out)
+            positions = self.brick_ts.tables.edges.left[l_out // 8]
+            chunks = schedule_out_nodes(
+                l_out, costs, positions, self.num_processes, self.chunksize
+            )
+            with graph.SharedArrays.create(arrays) as shared, tqdm(
+                total=len(l_out),
+                disable=not self.progress,
+                desc="Reduce graph: iterate over out nodes",
+            ) as progress_bar:
+                with multiprocessing.Pool(
+                    processes=self.num_processes,
+                    initializer=init_reach_worker,
+                    initargs=(
+                        shared.spec,
+                        self.path_weight_threshold,
+                        self.backend,
+                        self.epsilon,
+                        thresholds,
                     ),
-                    total=len(l_out),
-                    disable=not self.progress,
-                    desc="Reduce graph: iterate over out nodes",
-                ):
-                    for new_edge in row[2]:
-                        R.add_edge(new_edge[0], new_edge[1], weight=new_edge[2])
-                    reach_star_sets[row[0]] = row[1]
-
-        return R
+                ) as pool:
+                    for num_out_nodes, new_edges in pool.imap_unordered(
+                        find_shared_reach_sets, chunks
+                    ):
+                        add_edges(new_edges)
+                        progress_bar.update(num_out_nodes)
+
+        # Haplotype node IDs are -brick_haplo_id - 1, down to -num_nodes
+        reduced_graphs = [
+            ReducedGraph.from_builder(snp_nodes, builder, self.brick_ts.num_nodes)
+            for builder in builders
+        ]
+        if thresholds is None:
+            return reduced_graphs[0]
+        return reduced_graphs
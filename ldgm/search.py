@@ -0,0 +1,492 @@
+"""
+Bounded shortest path searches in the brick-haplo graph
+"""
+import heapq
+
+import networkx as nx
+import numpy as np
+
+
+def bounded_dijkstra(brick_graph, source, cutoff, excluded=()):
+    """
+    Returns a dictionary of the lengths of the shortest paths from ``source`` to
+    every vertex within ``cutoff`` of it in a CSRGraph, ignoring the vertices in
+    ``excluded``. Only the vertices within ``cutoff`` of ``source`` (and their
+    edges) are visited. If ``cutoff`` is None, the search is unbounded.
+    """
+    if cutoff is None:
+        cutoff = np.inf
+    indptr = brick_graph.indptr
+    indices = brick_graph.indices
+    weights = brick_graph.weights
+    dist = {}
+    seen = {source: 0}
+    heap = [(0, source)]
+    while heap:
+        d, vertex = heapq.heappop(heap)
+        if vertex in dist:
+            continue
+        dist[vertex] = d
+        start = indptr[vertex]
+        stop = indptr[vertex + 1]
+        for neighbour, weight in zip(
+            indices[start:stop].tolist(), weights[start:stop].tolist()
+        ):
+            if neighbour in dist or neighbour in excluded:
+                continue
+            length = d + weight
+            if length <= cutoff and length < seen.get(neighbour, cutoff + 1):
+                seen[neighbour] = length
+                heapq.heappush(heap, (length, neighbour))
+    return dist
+
+
+def reachable_vertices(brick_graph, sources, cutoff):
+    """
+    Returns the sorted array of the vertices within ``cutoff`` of any of the
+    ``sources`` in a CSRGraph. Every vertex in the reach set of a source, with
+    or without excluded vertices, is in this set. Path lengths are relaxed a
+    frontier of vertices at a time with numpy, until no path gets shorter.
+    """
+    if cutoff is None:
+        cutoff = np.inf
+    dist = np.full(brick_graph.num_vertices, np.inf)
+    frontier = np.unique(np.asarray(sources, dtype=np.int64))
+    dist[frontier] = 0
+    degree = np.diff(brick_graph.indptr)
+    while len(frontier) > 0:
+        edges = brick_graph.successor_edges(frontier)
+        dst = brick_graph.indices[edges]
+        length = (
+            np.repeat(dist[frontier], degree[frontier]) + brick_graph.weights[edges]
+        )
+        shorter = (length <= cutoff) & (length < dist[dst])
+        dst = dst[shorter]
+        np.minimum.at(dist, dst, length[shorter])
+        frontier = np.unique(dst)
+    return np.flatnonzero(dist <= cutoff)
+
+
+def quantize_weights(weights, epsilon):
+    """
+    Rounds non-negative edge weights to the nearest integer multiple of epsilon,
+    returning the integer multiples.
+    """
+    return np.rint(weights / epsilon).astype(np.int64)
+
+
+def dial_buckets(quantized, cutoff, epsilon):
+    """
+    Returns the circular array of empty buckets for dial_search(): one more
+    than the largest quantized edge weight which is within the cutoff, that is
+    at most cutoff / epsilon + 1 buckets.
+    """
+    max_bucket = int(np.floor(cutoff / epsilon + 1e-9))
+    max_weight = int(np.max(quantized[quantized <= max_bucket], initial=0))
+    return [[] for _ in range(max_weight + 1)]
+
+
+def dial_search(
+    brick_graph, source, cutoff, epsilon, quantized, excluded=(), buckets=None
+):
+    """
+    Bounded search with a bucket queue (Dial's algorithm) on edge weights
+    quantized to multiples of ``epsilon`` (``quantized``, from
+    quantize_weights()). Vertices whose quantized distance is the same
+    multiple of epsilon share a bucket, and a cursor visits the buckets in
+    increasing order of distance, so no comparisons between vertices are made.
+
+    No edge longer than the cutoff is followed, and every other edge from the
+    bucket under the cursor leads to one of the next max_weight buckets, where
+    max_weight is the largest quantized weight of these edges. The buckets are
+    therefore held in a circular array of max_weight + 1 lists (``buckets``,
+    from dial_buckets(), which is allocated if None and is left empty for the
+    next search), indexed by distance modulo its length. The cursor moves one
+    bucket at a time and stops when no vertex is left in the buckets, which is
+    at the latest when it passes cutoff / epsilon. A search therefore costs
+    O(visited edges + cutoff / epsilon): the ratio of the cutoff to epsilon
+    bounds both the number of buckets and the number of steps of the cursor,
+    so epsilon should not be much smaller than the resolution the path weights
+    need.
+
+    Returns a dictionary of the quantized lengths of the shortest paths from
+    ``source`` to every vertex within ``cutoff``, ignoring the vertices in
+    ``excluded``. Each edge weight is rounded by at most epsilon / 2, so a path
+    of k edges has a quantized length within k * epsilon / 2 of its exact
+    length. The returned lengths are therefore within k * epsilon / 2 of the
+    exact ones, where k is the largest number of edges on the exact and the
+    quantized shortest paths, and a vertex within that margin of the cutoff may
+    be included or excluded differently to an exact search.
+    """
+    if cutoff is None:
+        raise ValueError("The dial search requires a finite cutoff")
+    indptr = brick_graph.indptr
+    indices = brick_graph.indices
+    max_bucket = int(np.floor(cutoff / epsilon + 1e-9))
+    if buckets is None:
+        buckets = dial_buckets(quantized, cutoff, epsilon)
+    num_buckets = len(buckets)
+    buckets[0].append(source)
+    dist = {source: 0}
+    # The number of vertices in the buckets, including those whose distance
+    # has since been shortened. They are all within max_bucket.
+    pending = 1
+    d = 0
+    while pending > 0:
+        bucket = buckets[d % num_buckets]
+        if not bucket:
+            d += 1
+            continue
+        # Zero weight edges append to the bucket being visited
+        index = 0
+        while index < len(bucket):
+            vertex = bucket[index]
+            index += 1
+            if dist[vertex] != d:
+                continue
+            start = indptr[vertex]
+            stop = indptr[vertex + 1]
+            for neighbour, weight in zip(
+                indices[start:stop].tolist(), quantized[start:stop].tolist()
+            ):
+                if neighbour in excluded:
+                    continue
+                length = d + weight
+                if length <= max_bucket and length < dist.get(
+                    neighbour, max_bucket + 1
+                ):
+                    dist[neighbour] = length
+                    buckets[length % num_buckets].append(neighbour)
+                    pending += 1
+        pending -= len(bucket)
+        bucket.clear()
+        d += 1
+    return {vertex: d * epsilon for vertex, d in dist.items()}
+
+
+def shortcut_dijkstra(
+    indptr, indices, weights, source, cutoff, excluded, reach, targets
+):
+    """
+    bounded_dijkstra() from ``source`` (on the lists of a CSRGraph's arrays),
+    ignoring the vertices in ``excluded``, which takes the reach sets of
+    tree_reach_sets() as shortcuts. A vertex with a reach set in ``reach`` which
+    does not contain any excluded vertex has no path within the cutoff through
+    them, so its reach set, shifted by its path weight, is merged into the
+    result instead of searching further from it. Returns the lengths of the
+    shortest paths to the ``targets`` within ``cutoff``.
+    """
+    dist = {}
+    result = {}
+    seen = {source: 0}
+    heap = [(0, source)]
+    while heap:
+        d, vertex = heapq.heappop(heap)
+        if vertex in dist:
+            continue
+        dist[vertex] = d
+        if targets[vertex] and d < result.get(vertex, np.inf):
+            result[vertex] = d
+        reach_set = reach.get(vertex) if vertex != source else None
+        if reach_set is not None and excluded.isdisjoint(reach_set):
+            for target, length in reach_set.items():
+                length += d
+                if length <= cutoff and length < result.get(target, np.inf):
+                    result[target] = length
+            continue
+        for edge in range(indptr[vertex], indptr[vertex + 1]):
+            neighbour = indices[edge]
+            if neighbour in dist or neighbour in excluded:
+                continue
+            length = d + weights[edge]
+            if length <= cutoff and length < seen.get(neighbour, np.inf):
+                seen[neighbour] = length
+                heapq.heappush(heap, (length, neighbour))
+    return result
+
+
+def tree_reach_sets(brick_graph, cutoff, sources, targets=None):
+    """
+    Computes the reach sets of all ``sources`` (out vertices) in a single
+    dynamic programming pass, sharing work between sources instead of searching
+    from each one.
+
+    Brick-haplo graph edges go from child to parent bricks between up vertices,
+    from parent to child bricks between down vertices, and from up (or out and
+    uturn) vertices to down vertices, so the graph is acyclic. Vertices are
+    visited in reverse topological order: the down vertices from the youngest
+    bricks to the oldest, then the up vertices from the oldest bricks to the
+    youngest. The reach set of each vertex (the lengths of the shortest paths
+    to the vertices within ``cutoff``) is the merge of the reach sets of its
+    successors, shifted by the edge weights. A reach set is freed once all the
+    predecessors of its vertex have been visited. If ``targets`` is not None,
+    only the vertices where this boolean array is True are kept in reach sets,
+    which keeps them small.
+
+    The reach set of a source ignores the other vertices of its brick (see
+    excluded_vertices()). Only graphs with rule two have paths from an out
+    vertex back to its own brick, e.g. up to its parent's uturn vertex and
+    back down to its down before vertex. The merged reach set of a source
+    which contains one of its excluded vertices is replaced by a
+    shortcut_dijkstra(), which only searches until it meets vertices whose
+    reach sets are held and do not contain the excluded vertices: its parent's
+    and ancestors' vertices with paths back down to the source's brick.
+    Returns a dictionary mapping each source to its reach set.
+    """
+    if cutoff is None:
+        cutoff = np.inf
+    indptr = brick_graph.indptr.tolist()
+    indices = brick_graph.indices.tolist()
+    weights = brick_graph.weights.tolist()
+    _, dst, _ = brick_graph.edge_arrays()
+    remaining = np.bincount(dst, minlength=brick_graph.num_vertices).tolist()
+    sources = set(sources)
+    if targets is None:
+        targets = np.ones(brick_graph.num_vertices, dtype=bool)
+    targets = targets.tolist()
+    reach = {}
+    results = {}
+    for vertex in brick_graph.topological_order()[::-1].tolist():
+        reach_set = {vertex: 0} if targets[vertex] else {}
+        for edge in range(indptr[vertex], indptr[vertex + 1]):
+            weight = weights[edge]
+            successor = indices[edge]
+            if weight <= cutoff:
+                for target, length in reach[successor].items():
+                    length += weight
+                    if length <= cutoff and length < reach_set.get(target, np.inf):
+                        reach_set[target] = length
+        if vertex in sources:
+            excluded = excluded_vertices(vertex)
+            if not excluded.isdisjoint(reach_set):
+                reach_set = shortcut_dijkstra(
+                    indptr, indices, weights, vertex, cutoff, excluded, reach, targets
+                )
+            results[vertex] = reach_set
+        # Successors are freed after the source's search, which may use them
+        for edge in range(indptr[vertex], indptr[vertex + 1]):
+            successor = indices[edge]
+            remaining[successor] -= 1
+            if remaining[successor] == 0:
+                del reach[successor]
+        if remaining[vertex] > 0:
+            reach[vertex] = reach_set
+    return results
+
+
+def networkx_dijkstra(nx_graph, source, cutoff, excluded=()):
+    """
+    Reference implementation of bounded_dijkstra() for a ``networkx.DiGraph``,
+    searching the subgraph without the excluded vertices.
+    """
+    subgraph = nx_graph.subgraph(
+        [node for node in nx_graph.nodes() if node not in excluded]
+    )
+    return nx.single_source_dijkstra_path_length(
+        subgraph, source, cutoff=cutoff, weight="weight"
+    )
+
+
+# Offsets from an out vertex of the vertices ignored when searching from it
+EXCLUDED_OFFSETS = np.array([-4, -3, -2, -1, 1])
+
+
+def excluded_vertices(out_node):
+    """
+    Returns the vertices ignored when searching from an out vertex: the other
+    vertices of its brick, except the uturn vertex.
+    """
+    return set((out_node + EXCLUDED_OFFSETS).tolist())
+
+
+# Backends of ReachSearch
+BACKENDS = ["dijkstra", "networkx", "scipy", "dial", "tree"]
+
+
+class ReachSearch:
+    """
+    Finds the reach sets of out vertices in a CSR brick-haplo graph: the lengths
+    of the shortest paths from an out vertex to every vertex within ``cutoff``,
+    ignoring the other vertices of its brick (see excluded_vertices()).
+
+    The search is run by one of the following backends:
+    dijkstra: bounded_dijkstra(), which only visits the vertices within cutoff.
+    networkx: networkx_dijkstra(), the reference implementation.
+    scipy: ``scipy.sparse.csgraph.dijkstra`` with ``limit=cutoff``, run on
+        batches of ``batch_size`` out vertices (64 by default) with the
+        excluded vertices of the whole batch masked, see masked_reach_sets().
+        Each batch allocates dense arrays of distances from its out vertices to
+        the vertices within the cutoff of any of them, so batches of out
+        vertices with nearby IDs, which are nearby in the brick ancestry, keep
+        these arrays small.
+    dial: dial_search(), a bucket queue search on edge weights rounded to
+        multiples of ``epsilon``. The path weights it finds are approximate,
+        see dial_search() for the error bound.
+    tree: tree_reach_sets(), which computes the reach sets of all the out
+        vertices requested from reach_sets() in a single pass over the brick
+        ancestry. If the boolean mask of ``labeled`` bricks is given, reach sets
+        only contain the vertices used by reach* (and the excluded vertices):
+        the vertices of labeled bricks and of haplotypes. Excluded vertices are
+        handled within the pass (see tree_reach_sets()). The pass is faster
+        than dijkstra on graphs without rule two, but slower on graphs with
+        rule two, whose sibling sets make each vertex merge the reach sets of
+        many others, so ``ldgm.make_ldgm()`` only uses it without rule two.
+    """
+
+    def __init__(
+        self,
+        brick_graph,
+        cutoff,
+        backend="dijkstra",
+        batch_size=None,
+        epsilon=1e-3,
+        labeled=None,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, must be one of {BACKENDS}")
+        self.brick_graph = brick_graph
+        self.cutoff = cutoff
+        self.backend = backend
+        self.epsilon = epsilon
+        if backend == "networkx":
+            self.nx_graph = brick_graph.to_networkx()
+        elif backend == "scipy":
+            try:
+                from scipy.sparse import csgraph
+                from scipy.sparse import csr_matrix
+            except ImportError:
+                raise ImportError("The scipy backend requires scipy to be installed")
+            self.csgraph = csgraph
+            self.csr_matrix = csr_matrix
+            if batch_size is None:
+                batch_size = 64
+        elif backend == "dial":
+            if epsilon <= 0:
+                raise ValueError("epsilon must be positive")
+            self.quantized = quantize_weights(brick_graph.weights, epsilon)
+            self.buckets = None
+            if cutoff is not None:
+                self.buckets = dial_buckets(self.quantized, cutoff, epsilon)
+        elif backend == "tree":
+            self.targets = None
+            if labeled is not None:
+                vertices = np.arange(brick_graph.num_vertices)
+                vertex_type = vertices % 8
+                bricks = np.minimum(vertices // 8, len(labeled) - 1)
+                self.targets = (vertex_type >= 6) | (
+                    (vertex_type != 4) & labeled[bricks]
+                )
+        self.batch_size = batch_size
+
+    def reach_set(self, out_node):
+        """
+        Returns a dictionary of the lengths of the shortest paths from
+        ``out_node`` to the vertices within the cutoff.
+        """
+        excluded = excluded_vertices(out_node)
+        if self.backend == "networkx":
+            return networkx_dijkstra(self.nx_graph, out_node, self.cutoff, excluded)
+        if self.backend == "dial":
+            return dial_search(
+                self.brick_graph,
+                out_node,
+                self.cutoff,
+                self.epsilon,
+                self.quantized,
+                excluded,
+                self.buckets,
+            )
+        return bounded_dijkstra(self.brick_graph, out_node, self.cutoff, excluded)
+
+    def reach_sets(self, out_nodes):
+        """
+        Yields (out node, reach set) tuples for the given out vertices, in order.
+        """
+        if self.backend == "tree":
+            reach_sets = tree_reach_sets(
+                self.brick_graph, self.cutoff, out_nodes, self.targets
+            )
+            for out_node in out_nodes:
+                yield out_node, reach_sets.pop(out_node)
+            return
+        if self.backend != "scipy":
+            for out_node in out_nodes:
+                yield out_node, self.reach_set(out_node)
+            return
+        out_nodes = np.asarray(out_nodes, dtype=np.int64)
+        for start in range(0, len(out_nodes), self.batch_size):
+            stop = start + self.batch_size
+            reach_sets = self.masked_reach_sets(out_nodes[start:stop])
+            for out_node in out_nodes[start:stop].tolist():
+                yield out_node, reach_sets.pop(out_node)
+
+    def masked_reach_sets(self, out_nodes):
+        """
+        Returns a dictionary of the reach sets of an array of out vertices,
+        found by the scipy backend. Each batch of out vertices is searched by a
+        single ``scipy.sparse.csgraph.dijkstra`` on the subgraph of the vertices
+        within the cutoff of the batch, without the edges into the excluded
+        vertices of every out vertex in the batch. An out vertex with a path
+        within the cutoff to the excluded vertices of another out vertex of the
+        batch may have lost paths through them, and is searched again in a
+        batch without the bricks of these out vertices. Groups of out vertices
+        whose excluded vertices do not interact are formed from these
+        conflicts, and an out vertex in a batch of its own is searched on the
+        subgraph without only its own excluded vertices.
+        """
+        limit = np.inf if self.cutoff is None else self.cutoff
+        reach_sets = {}
+        conflicts = {}
+        batches = [out_nodes]
+        while batches:
+            batch = batches.pop()
+            vertices = reachable_vertices(self.brick_graph, batch, limit)
+            subgraph, blocks = self.brick_graph.block_subgraph(vertices)
+            sources = np.searchsorted(blocks, batch // 8) * 8 + 4
+            excluded = (sources[:, np.newaxis] + EXCLUDED_OFFSETS).ravel()
+            src, dst, weights = subgraph.edge_arrays()
+            masked = np.isin(dst, excluded)
+            num_vertices = subgraph.num_vertices
+            unmasked = subgraph.filter_edges(~masked)
+            matrix = self.csr_matrix(
+                (unmasked.weights, unmasked.indices, unmasked.indptr),
+                shape=(num_vertices, num_vertices),
+            )
+            dist = self.csgraph.dijkstra(matrix, indices=sources, limit=limit)
+            # Paths within the cutoff into the excluded vertices of another out
+            # vertex of the batch
+            lengths = dist[:, src[masked]] + weights[masked]
+            cut = (
+                np.isfinite(lengths)
+                & (lengths <= limit)
+                & (dst[masked] // 8 != sources[:, np.newaxis] // 8)
+            )
+            failed = []
+            for out_node, row, row_cut in zip(batch.tolist(), dist, cut):
+                if np.any(row_cut):
+                    bricks = blocks[dst[masked][row_cut] // 8].tolist()
+                    conflicts.setdefault(out_node, set()).update(bricks)
+                    failed.append(out_node)
+                    continue
+                reached = np.flatnonzero(np.isfinite(row))
+                global_ids = blocks[reached // 8] * 8 + reached % 8
+                reach_sets[out_node] = dict(
+                    zip(global_ids.tolist(), row[reached].tolist())
+                )
+            # Regroup the failed out vertices so that no out vertex is in a
+            # batch with the bricks it conflicts with
+            groups = []
+            for out_node in failed:
+                brick = out_node // 8
+                for group in groups:
+                    if brick not in group[1] and group[0].isdisjoint(
+                        conflicts[out_node]
+                    ):
+                        group[0].add(brick)
+                        group[1].update(conflicts[out_node])
+                        group[2].append(out_node)
+                        break
+                else:
+                    groups.append(({brick}, set(conflicts[out_node]), [out_node]))
+            batches += [np.array(group[2], dtype=np.int64) for group in groups]
+        return reach_sets
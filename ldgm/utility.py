@@ -10,6 +10,7 @@ import numpy as np
 import tskit
 import networkx as nx
 
+from . import brickindex
 from . import provenance
 
 
@@ -162,7 +163,9 @@ def identify_bricks(bricked_ts):
     return identified_bricks
 
 
-def make_snplist(bricked_ts, site_metadata_id=None, population_dict=None):
+def make_snplist(
+    bricked_ts, site_metadata_id=None, population_dict=None, brick_index=None
+):
     """
     Return list of SNPs in the tree sequence.
     """
@@ -182,11 +185,13 @@ def make_snplist(bricked_ts, site_metadata_id=None, population_dict=None):
         assert len(site_ids) == bricked_ts.num_sites
         return_lists["site_ids"] = np.array(site_ids)
 
-    identified_bricks_dict = identify_bricks(bricked_ts)
+    # This function only supports infinite sites
+    assert bricked_ts.num_sites == bricked_ts.num_mutations
+    if brick_index is None:
+        brick_index = brickindex.BrickIndex.from_ts(bricked_ts)
     index = np.full(bricked_ts.num_sites, -1)
-    for site_id, site_targets in identified_bricks_dict.items():
-        for target in site_targets:
-            index[target] = site_id
+    on_brick = brick_index.mut_bricks != tskit.NULL
+    index[on_brick] = brick_index.ldgm_ids[brick_index.mut_bricks[on_brick]]
     return_lists["index"] = index
     anc_alleles = tskit.unpack_strings(
         bricked_ts.tables.sites.ancestral_state,
@@ -215,12 +220,12 @@ def make_snplist(bricked_ts, site_metadata_id=None, population_dict=None):
     return pd.DataFrame(return_lists, columns=list(return_lists.keys()))
 
 
-def convert_node_ids(reduced_graph, bricked_ts):
-    bricks_to_muts = get_mut_edges(bricked_ts)
-    old_to_new_ids = {}
-    for new_brick, (old_brick, muts) in enumerate(bricks_to_muts.items()):
-        for mut in muts:
-            old_to_new_ids[mut] = new_brick
+def convert_node_ids(reduced_graph, bricked_ts, brick_index=None):
+    if brick_index is None:
+        brick_index = brickindex.BrickIndex.from_ts(bricked_ts)
+    muts = np.where(brick_index.mut_bricks != tskit.NULL)[0]
+    new_ids = brick_index.ldgm_ids[brick_index.mut_bricks[muts]]
+    old_to_new_ids = dict(zip(muts.tolist(), new_ids.tolist()))
     return nx.relabel_nodes(reduced_graph, mapping=old_to_new_ids)
 
 
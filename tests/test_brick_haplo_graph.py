@@ -2,12 +2,14 @@
 Test cases for building the brick graph
 """
 import io
+import itertools
 import unittest
 
 import ldgm
 import numpy as np
 import pytest
 import msprime
+import networkx as nx
 import tskit
 
 from . import utility_functions
@@ -16,7 +18,7 @@ from . import utility_functions
 class TestExampleTrees(unittest.TestCase):
     def verify(self, ts):
         bts = ldgm.brick_ts(ts, recombination_freq_threshold=None)
-        g = ldgm.brick_haplo_graph(bts)
+        g = ldgm.brick_haplo_graph(bts, as_networkx=True)
         self.check_rule_0(bts, g)
         self.check_rule_1(bts, g)
         self.check_out_nodes(g)
@@ -177,8 +179,12 @@ class TestExampleTrees(unittest.TestCase):
     def test_triangle_brickgraph(self):
         ts = utility_functions.triangle_example()
         bts = ldgm.brick_ts(ts)
-        brick_haplo_graph_wo_sibs = ldgm.brick_haplo_graph(bts, make_sibs=False)
-        brick_haplo_graph_w_sibs = ldgm.brick_haplo_graph(bts, make_sibs=True)
+        brick_haplo_graph_wo_sibs = ldgm.brick_haplo_graph(
+            bts, make_sibs=False, as_networkx=True
+        )
+        brick_haplo_graph_w_sibs = ldgm.brick_haplo_graph(
+            bts, make_sibs=True, as_networkx=True
+        )
         edges_wo_sibs = list(brick_haplo_graph_wo_sibs.edges())
         edges_w_sibs = list(brick_haplo_graph_w_sibs.edges())
         for name, edges in {"nosibs": edges_wo_sibs, "sibs": edges_w_sibs}.items():
@@ -251,21 +257,173 @@ class TestEdgeWeightThreshold(unittest.TestCase):
             random_seed=1,
         )
         bts = ldgm.brick_ts(ts)
-        brick_haplo_graph_2 = ldgm.brick_haplo_graph(bts, edge_weight_threshold=2)
+        brick_haplo_graph_2 = ldgm.brick_haplo_graph(
+            bts, edge_weight_threshold=2, as_networkx=True
+        )
         edge_weights_2 = [
             brick_haplo_graph_2.get_edge_data(u, v)["weight"]
             for u, v in brick_haplo_graph_2.edges()
         ]
         assert np.max(edge_weights_2) < 2
-        brick_haplo_graph_4 = ldgm.brick_haplo_graph(bts, edge_weight_threshold=4)
+        brick_haplo_graph_4 = ldgm.brick_haplo_graph(
+            bts, edge_weight_threshold=4, as_networkx=True
+        )
         edge_weights_4 = [
             brick_haplo_graph_4.get_edge_data(u, v)["weight"]
             for u, v in brick_haplo_graph_4.edges()
         ]
         assert np.max(edge_weights_4) < 4
-        brick_haplo_graph_8 = ldgm.brick_haplo_graph(bts, edge_weight_threshold=8)
+        brick_haplo_graph_8 = ldgm.brick_haplo_graph(
+            bts, edge_weight_threshold=8, as_networkx=True
+        )
         edge_weights_8 = [
             brick_haplo_graph_8.get_edge_data(u, v)["weight"]
             for u, v in brick_haplo_graph_8.edges()
         ]
         assert np.max(edge_weights_8) < 8
+
+
+class TestEdgeWeights(unittest.TestCase):
+    """
+    Test that edge weights match the odds of the bricks they connect.
+    """
+
+    def test_edge_weights(self):
+        ts = msprime.simulate(
+            30,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=3e4,
+            random_seed=2,
+        )
+        bts = ldgm.brick_ts(ts)
+        freqs = ldgm.utility.get_brick_frequencies(bts)
+        odds = freqs / (1 - freqs)
+        g = ldgm.brick_haplo_graph(bts, as_networkx=True)
+        for u, v, weight in g.edges(data="weight"):
+            if v % 8 >= 6:
+                # Rule zero
+                assert weight == 0
+            else:
+                odds_u = odds[u // 8]
+                odds_v = odds[v // 8]
+                assert np.isclose(weight, abs(np.log(odds_u / odds_v))) or np.isclose(
+                    weight, abs(np.log(odds_u * odds_v))
+                )
+
+
+class TestSiblingPairs(unittest.TestCase):
+    """
+    Test that the sibling pairs connected by rule two match connecting every
+    sibling set of every brick entering each tree, in trees with polytomies.
+    """
+
+    def verify(self, ts, edge_weight_threshold):
+        bts = ldgm.brick_ts(ts, progress=False)
+        grapher = ldgm.brickhaplograph.BrickHaploGraph(
+            bts, edge_weight_threshold, make_sibs=True, progress=False
+        )
+        grapher.make_brick_graph()
+        log_odds = np.log(grapher.odds)
+        expected = set()
+        node_edge_dict = {}
+        for tree, (_, edges_out, edges_in) in zip(bts.trees(), bts.edge_diffs()):
+            for edge in edges_out:
+                node_edge_dict.pop(edge.child)
+            for edge in edges_in:
+                node_edge_dict[edge.child] = edge.id
+            for edge in edges_in:
+                if not grapher.rule_two_bricks[edge.id]:
+                    continue
+                siblings = [node_edge_dict[c] for c in tree.children(edge.parent)]
+                for a, b in itertools.combinations(siblings, 2):
+                    weight = abs(log_odds[a] + log_odds[b])
+                    if edge_weight_threshold is None or weight < edge_weight_threshold:
+                        expected.add((min(a, b), max(a, b)))
+        bricks_a, bricks_b = grapher.sibling_pairs()
+        weights = grapher.rule_two_weights(bricks_a, bricks_b)
+        keep = grapher.below_threshold(weights)
+        pairs = [
+            (min(a, b), max(a, b))
+            for a, b in zip(bricks_a[keep].tolist(), bricks_b[keep].tolist())
+        ]
+        assert len(pairs) == len(set(pairs))
+        assert set(pairs) == expected
+
+    def test_polytomies(self):
+        ts = msprime.sim_ancestry(
+            30,
+            model=msprime.BetaCoalescent(alpha=1.1),
+            recombination_rate=1e-8,
+            sequence_length=5e4,
+            population_size=1e4,
+            random_seed=2,
+        )
+        ts = msprime.sim_mutations(ts, rate=1e-8, random_seed=2, discrete_genome=False)
+        for edge_weight_threshold in [None, 1, 4]:
+            self.verify(ts, edge_weight_threshold)
+
+
+class TestRuleOnePairs(unittest.TestCase):
+    """
+    Test that rule one emits each (parent brick, child brick) pair of every tree
+    exactly once.
+    """
+
+    def test_rule_one_pairs(self):
+        ts = msprime.simulate(
+            30,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=5e4,
+            random_seed=4,
+        )
+        bts = ldgm.brick_ts(ts, progress=False)
+        grapher = ldgm.brickhaplograph.BrickHaploGraph(bts, None, progress=False)
+        expected = set()
+        node_edge_dict = {}
+        for tree, (_, edges_out, edges_in) in zip(bts.trees(), bts.edge_diffs()):
+            for edge in edges_out:
+                node_edge_dict.pop(edge.child)
+            for edge in edges_in:
+                node_edge_dict[edge.child] = edge.id
+            for node, brick in node_edge_dict.items():
+                parent = tree.parent(node)
+                if parent in node_edge_dict:
+                    expected.add((node_edge_dict[parent], brick))
+        parents, children = grapher.rule_one_pairs()
+        pairs = list(zip(parents.tolist(), children.tolist()))
+        assert len(pairs) == len(set(pairs))
+        assert set(pairs) == expected
+
+
+class TestBrickHaploGraphs(unittest.TestCase):
+    """
+    Test that the graphs made in a single pass match separately made graphs.
+    """
+
+    def test_brick_haplo_graphs(self):
+        ts = msprime.simulate(
+            30,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=3e4,
+            random_seed=5,
+        )
+        bts = ldgm.brick_ts(ts, progress=False)
+        for edge_weight_threshold in [None, 4]:
+            graph, graph_rule_two = ldgm.brick_haplo_graphs(
+                bts, edge_weight_threshold, progress=False, as_networkx=True
+            )
+            for make_sibs, single_pass in [(False, graph), (True, graph_rule_two)]:
+                separate = ldgm.brick_haplo_graph(
+                    bts,
+                    edge_weight_threshold,
+                    make_sibs=make_sibs,
+                    progress=False,
+                    as_networkx=True,
+                )
+                assert nx.utils.graphs_equal(single_pass, separate)
@@ -0,0 +1,108 @@
+"""
+Test cases for the brick index
+"""
+import unittest
+
+import ldgm
+import msprime
+import numpy as np
+import tskit
+
+from . import utility_functions
+
+
+class TestTraverseBricks(unittest.TestCase):
+    """
+    Test the traverse_bricks() function.
+    """
+
+    def test_traverse_bricks(self):
+        ts = msprime.simulate(
+            50,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=5e4,
+            random_seed=1,
+        )
+        bricked = ldgm.brick_ts(ts, recombination_freq_threshold=None)
+        traversal = ldgm.brickindex.traverse_bricks(bricked)
+        assert np.array_equal(
+            traversal.freqs, ldgm.utility.get_brick_frequencies(bricked)
+        )
+        bricks_to_muts = ldgm.utility.get_mut_edges(bricked)
+        for brick, muts in bricks_to_muts.items():
+            assert np.all(traversal.mut_bricks[muts] == brick)
+        tree_bricks = traversal.tree_bricks
+        assert len(tree_bricks.tree_offsets) == bricked.num_trees + 1
+        assert np.array_equal(np.sort(tree_bricks.bricks), np.arange(bricked.num_edges))
+        for tree, (_, _, edges_in) in zip(bricked.trees(), bricked.edge_diffs()):
+            start = tree_bricks.tree_offsets[tree.index]
+            for index, edge in enumerate(edges_in, start):
+                assert tree_bricks.bricks[index] == edge.id
+                group = tree_bricks.sibling_groups[index]
+                num_siblings = (
+                    tree_bricks.sibling_offsets[group + 1]
+                    - tree_bricks.sibling_offsets[group]
+                )
+                assert num_siblings == len(tree.children(edge.parent))
+                num_children = (
+                    tree_bricks.child_offsets[index + 1]
+                    - tree_bricks.child_offsets[index]
+                )
+                assert num_children == len(tree.children(edge.child))
+                if tree.parent(edge.parent) == tskit.NULL:
+                    assert tree_bricks.parent_bricks[index] == tskit.NULL
+                else:
+                    assert tree_bricks.parent_bricks[index] != tskit.NULL
+
+
+class TestBrickIndex(unittest.TestCase):
+    """
+    Test the BrickIndex matches the dictionaries returned by get_mut_edges()
+    """
+
+    def verify(self, bricked):
+        brick_index = ldgm.brickindex.BrickIndex.from_ts(bricked)
+        bricks_to_muts = ldgm.utility.get_mut_edges(bricked)
+        assert list(brick_index.bricks_to_muts().items()) == list(
+            bricks_to_muts.items()
+        )
+        assert brick_index.num_labeled == len(bricks_to_muts)
+        assert np.sum(brick_index.labeled) == len(bricks_to_muts)
+        for ldgm_id, (brick, muts) in enumerate(bricks_to_muts.items()):
+            assert brick_index.labeled[brick]
+            assert brick_index.first_muts[brick] == muts[0]
+            assert brick_index.ldgm_ids[brick] == ldgm_id
+            assert np.array_equal(brick_index.muts(brick), muts)
+        unlabeled = ~brick_index.labeled
+        assert np.all(brick_index.first_muts[unlabeled] == tskit.NULL)
+        assert np.all(brick_index.ldgm_ids[unlabeled] == tskit.NULL)
+        for tree, (_, _, edges_in) in zip(bricked.trees(), bricked.edge_diffs()):
+            for edge in edges_in:
+                assert brick_index.entry_trees[edge.id] == tree.index
+        freqs = ldgm.utility.get_brick_frequencies(bricked)
+        assert np.array_equal(brick_index.freqs, freqs)
+        inner = (freqs > 0) & (freqs < 1)
+        assert np.allclose(
+            brick_index.log_odds[inner], np.log(freqs[inner] / (1 - freqs[inner]))
+        )
+
+    def test_examples(self):
+        for ts in [
+            utility_functions.figure_one_example(),
+            utility_functions.supplementary_example(),
+            utility_functions.multiple_snps_branch(),
+        ]:
+            self.verify(ldgm.brick_ts(ts))
+
+    def test_simulated(self):
+        ts = msprime.simulate(
+            50,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=5e4,
+            random_seed=3,
+        )
+        self.verify(ldgm.brick_ts(ts))
@@ -4,6 +4,7 @@ Test cases for building a brick tree sequence
 import unittest
 
 import ldgm
+import msprime
 import pytest
 
 from . import utility_functions
@@ -39,3 +40,65 @@ class TestBrickTreeSequence(unittest.TestCase):
         bts = ldgm.brick_ts(ts, recombination_freq_threshold=(1 / 5))
         assert bts.num_edges == ts.num_edges
         assert ts.num_nodes == bts.num_nodes
+
+
+class TestSplitEdges(unittest.TestCase):
+    """
+    Test the array-backed bricking engine matches the naive implementation
+    """
+
+    def verify(self, ts, recombination_freq_threshold=None):
+        bricks = ldgm.bricks.Bricks(
+            ts,
+            recombination_freq_threshold=recombination_freq_threshold,
+            progress=False,
+        )
+        naive = bricks.naive_split_edges()
+        bts = bricks.split_edges()
+        assert naive.tables.edges == bts.tables.edges
+
+    def test_examples(self):
+        for name, val in utility_functions.__dict__.items():
+            if callable(val):
+                self.verify(val())
+
+    def test_simulated(self):
+        for seed in range(1, 4):
+            ts = msprime.simulate(
+                30,
+                mutation_rate=1e-8,
+                recombination_rate=1e-8,
+                Ne=10000,
+                length=5e4,
+                random_seed=seed,
+            )
+            assert ts.num_trees > 1
+            for threshold in [None, 0.05, 0.2]:
+                self.verify(ts, recombination_freq_threshold=threshold)
+
+    def test_multiprocessing(self):
+        ts = msprime.simulate(
+            50,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=1e5,
+            random_seed=2,
+        )
+        for threshold in [None, 0.1]:
+            sequential = ldgm.brick_ts(ts, recombination_freq_threshold=threshold)
+            for num_processes in [2, 3, 7]:
+                parallel = ldgm.brick_ts(
+                    ts,
+                    recombination_freq_threshold=threshold,
+                    num_processes=num_processes,
+                )
+                assert sequential.tables.edges == parallel.tables.edges
+        for ts in [
+            utility_functions.single_tree_ts_n2(),
+            utility_functions.two_tree_ts(),
+            utility_functions.supplementary_example(),
+        ]:
+            sequential = ldgm.brick_ts(ts)
+            parallel = ldgm.brick_ts(ts, num_processes=2)
+            assert sequential.tables.edges == parallel.tables.edges
@@ -25,6 +25,15 @@ class TestLdgmArgParser:
             args = parser.parse_args(["reduce", self.infile, self.output, "4"])
         assert args.tree_sequence == self.infile
         assert args.output == self.output
+        assert args.thresholds is None
+
+    def test_thresholds(self):
+        with mock.patch("ldgm.cli.setup_logging"):
+            parser = cli.ldgm_cli_parser()
+            args = parser.parse_args(
+                ["reduce", self.infile, self.output, "4", "-t", "2", "6.5"]
+            )
+        assert args.thresholds == [2, 6.5]
 
 
 class TestEndToEnd:
@@ -55,3 +64,38 @@ class TestEndToEnd:
             random_seed=10,
         )
         self.compare_python_api(input_ts)
+
+    def test_thresholds(self):
+        input_ts = msprime.simulate(
+            50,
+            Ne=10000,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            length=2e4,
+            random_seed=10,
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_filename = pathlib.Path(tmpdir) / "input.trees"
+            input_ts.dump(input_filename)
+            output_filename = pathlib.Path(tmpdir) / "output"
+            full_cmd = f"reduce {input_filename} {output_filename} 4 -t 2 6.5 4 2"
+            cli.ldgm_main(full_cmd.split())
+            # Duplicated thresholds are written once, and the path_threshold
+            # without a suffix
+            assert sorted(path.name for path in pathlib.Path(tmpdir).iterdir()) == [
+                "input.trees",
+                "output",
+                "output_2",
+                "output_6.5",
+            ]
+            for threshold, filename in [
+                (4, output_filename),
+                (2, f"{output_filename}_2"),
+                (6.5, f"{output_filename}_6.5"),
+            ]:
+                output_network = nx.read_weighted_edgelist(filename, nodetype=int)
+                snp_graph, bts = ldgm.make_ldgm(input_ts, threshold)
+                # The edge list leaves out nodes without edges
+                snp_graph.remove_nodes_from(list(nx.isolates(snp_graph)))
+                em = nx.algorithms.isomorphism.numerical_edge_match("weight", 1)
+                assert nx.is_isomorphic(output_network, snp_graph, edge_match=em)
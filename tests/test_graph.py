@@ -0,0 +1,318 @@
+"""
+Test cases for the array-backed graphs
+"""
+import unittest
+
+import ldgm
+import msprime
+import networkx as nx
+import numpy as np
+
+from . import utility_functions
+
+
+class TestGraphBuilder(unittest.TestCase):
+    """
+    Test building CSR graphs from edges.
+    """
+
+    def test_duplicates_keep_min_weight(self):
+        builder = ldgm.graph.GraphBuilder(capacity=1)
+        builder.add_edge(2, 0, 3.0)
+        builder.add_edge(0, 1, 2.0)
+        builder.add_edges([0, 2, 0], [1, 0, 2], [1.0, 5.0, 0.0])
+        graph = builder.finalize(num_vertices=4)
+        assert graph.num_vertices == 4
+        assert graph.num_edges == 3
+        assert np.array_equal(graph.indptr, [0, 2, 2, 3, 3])
+        assert np.array_equal(graph.indices, [1, 2, 0])
+        assert np.array_equal(graph.weights, [1.0, 0.0, 3.0])
+        successors, weights = graph.successors(0)
+        assert np.array_equal(successors, [1, 2])
+        assert np.array_equal(weights, [1.0, 0.0])
+        assert np.array_equal(graph.nodes(), [0, 1, 2])
+
+    def test_scalar_weight(self):
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges(np.arange(5), np.arange(1, 6), 0.5)
+        graph = builder.finalize()
+        assert graph.num_vertices == 6
+        assert np.all(graph.weights == 0.5)
+
+    def test_empty(self):
+        graph = ldgm.graph.GraphBuilder().finalize()
+        assert graph.num_vertices == 0
+        assert graph.num_edges == 0
+        assert len(graph.to_networkx().edges()) == 0
+
+
+class TestNetworkxRoundTrip(unittest.TestCase):
+    """
+    Test the CSR brick-haplo graph matches its networkx view.
+    """
+
+    def verify(self, ts):
+        bts = ldgm.brick_ts(ts, progress=False)
+        # The CSR graph is the default, and networkx an opt-in view
+        csr_graph = ldgm.brick_haplo_graph(bts, progress=False)
+        assert isinstance(csr_graph, ldgm.graph.CSRGraph)
+        nx_graph = ldgm.brick_haplo_graph(bts, progress=False, as_networkx=True)
+        assert nx.utils.graphs_equal(csr_graph.to_networkx(), nx_graph)
+        round_trip = ldgm.graph.CSRGraph.from_networkx(
+            nx_graph, num_vertices=csr_graph.num_vertices
+        )
+        assert np.array_equal(round_trip.indptr, csr_graph.indptr)
+        assert np.array_equal(round_trip.indices, csr_graph.indices)
+        assert np.array_equal(round_trip.weights, csr_graph.weights)
+
+    def test_examples(self):
+        for ts in [
+            utility_functions.figure_one_example(),
+            utility_functions.supplementary_example(),
+            utility_functions.multiple_snps_branch(),
+        ]:
+            self.verify(ts)
+
+    def test_simulated(self):
+        ts = msprime.simulate(
+            30,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=3e4,
+            random_seed=2,
+        )
+        self.verify(ts)
+
+
+class TestFilterEdges(unittest.TestCase):
+    """
+    Test selecting edges of a CSR graph by their tags.
+    """
+
+    def test_filter_edges(self):
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges(
+            [0, 0, 1, 3], [1, 2, 3, 0], [1.0, 2.0, 3.0, 4.0], tag=[0, 1, 1, 0]
+        )
+        graph = builder.finalize()
+        filtered = graph.filter_edges(graph.tags == 1)
+        assert filtered.num_vertices == 4
+        assert np.array_equal(filtered.indptr, [0, 1, 2, 2, 2])
+        assert np.array_equal(filtered.indices, [2, 3])
+        assert np.array_equal(filtered.weights, [2.0, 3.0])
+        assert np.array_equal(filtered.tags, [1, 1])
+
+
+class TestHasEdges(unittest.TestCase):
+    """
+    Test looking up edges of a CSR graph.
+    """
+
+    def test_has_edges(self):
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges([0, 0, 2, 3], [1, 3, 0, 2], 1.0)
+        graph = builder.finalize()
+        found = graph.has_edges([0, 0, 1, 2, 3, 3, 5, 0], [1, 2, 0, 0, 2, 3, 0, 5])
+        assert found.tolist() == [True, False, False, True, True, False, False, False]
+        assert not np.any(ldgm.graph.GraphBuilder().finalize().has_edges([0], [1]))
+
+
+class TestContract(unittest.TestCase):
+    """
+    Test eliminating vertices which only pass paths along.
+    """
+
+    def test_chain(self):
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges(
+            [0, 1, 2, 3, 0, 5, 6, 6],
+            [1, 2, 3, 4, 5, 4, 7, 4],
+            [1.0, 0.0, 2.0, 0.5, 1.0, 3.0, 1.0, 1.0],
+        )
+        graph = builder.finalize()
+        keep = np.array([True, False, False, False, True, False, True, True])
+        contracted = graph.contract(keep)
+        expected = nx.DiGraph()
+        expected.add_weighted_edges_from([(0, 4, 3.5), (6, 4, 1.0), (6, 7, 1.0)])
+        assert nx.utils.graphs_equal(contracted.to_networkx(), expected)
+        # Paths longer than the cutoff are dropped
+        contracted = graph.contract(keep, cutoff=3)
+        assert np.array_equal(contracted.indices, [4, 7])
+        # Vertices with no predecessors are removed
+        keep[6] = False
+        assert np.array_equal(graph.contract(keep).indices, [4])
+
+    def verify(self, ts, path_weight_threshold):
+        bts = ldgm.brick_ts(ts, progress=False)
+        for csr_graph in ldgm.brick_haplo_graphs(
+            bts, progress=False, as_networkx=False
+        ):
+            contracted = ldgm.contract_graph(
+                csr_graph, bts, path_weight_threshold, as_networkx=False
+            )
+            assert contracted.num_edges <= csr_graph.num_edges
+            expected = ldgm.reduce_graph(
+                csr_graph, bts, path_weight_threshold, progress=False, as_networkx=True
+            )
+            reduced = ldgm.reduce_graph(
+                contracted, bts, path_weight_threshold, progress=False, as_networkx=True
+            )
+            assert expected.edges() == reduced.edges()
+            for u, v, weight in expected.edges(data="weight"):
+                assert np.isclose(reduced.edges[u, v]["weight"], weight)
+
+    def test_examples(self):
+        for ts in [
+            utility_functions.figure_one_example(),
+            utility_functions.supplementary_example(),
+            utility_functions.multiple_snps_branch(),
+        ]:
+            self.verify(ts, 100)
+
+    def test_simulated(self):
+        ts = msprime.simulate(
+            30,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=3e4,
+            random_seed=3,
+        )
+        self.verify(ts, 4)
+
+
+class TestEliminate(unittest.TestCase):
+    """
+    Test eliminating vertices matches removing them one at a time.
+    """
+
+    def verify(self, nx_graph, eliminated, cutoff, num_processes=1):
+        csr_graph = ldgm.graph.CSRGraph.from_networkx(nx_graph)
+        mask = np.zeros(csr_graph.num_vertices, dtype=bool)
+        mask[eliminated] = True
+        result = csr_graph.eliminate(
+            mask, cutoff=cutoff, num_processes=num_processes
+        ).to_networkx()
+        expected = nx_graph.copy()
+        for vertex in eliminated:
+            expected = ldgm.utility.remove_node(expected, vertex, cutoff)
+        assert set(result.edges()) == set(expected.edges())
+        for u, v, weight in expected.edges(data="weight"):
+            assert np.isclose(result.edges[u, v]["weight"], weight)
+
+    def test_random(self):
+        rng = np.random.default_rng(5)
+        for cutoff in [1, 2.5, 100]:
+            nx_graph = nx.gnp_random_graph(40, 0.1, seed=int(rng.integers(100)))
+            nx_graph = nx.DiGraph(nx_graph)
+            for u, v in nx_graph.edges():
+                nx_graph.edges[u, v]["weight"] = rng.uniform()
+            eliminated = rng.choice(40, size=25, replace=False).tolist()
+            self.verify(nx_graph, eliminated, cutoff)
+
+    def test_haplotypes(self):
+        ts = utility_functions.supplementary_example()
+        bts = ldgm.brick_ts(ts, progress=False)
+        bricked_graph = ldgm.brick_haplo_graph(bts, progress=False)
+        reduced_graph = ldgm.reduce_graph(
+            bricked_graph, bts, 100, progress=False, as_networkx=True
+        )
+        offset = bts.num_nodes
+        shifted = nx.relabel_nodes(
+            reduced_graph, {node: node + offset for node in reduced_graph.nodes()}
+        )
+        eliminated = [node + offset for node in reduced_graph.nodes() if node < 0]
+        self.verify(shifted, eliminated, 100)
+
+    def test_num_processes(self):
+        rng = np.random.default_rng(6)
+        nx_graph = nx.DiGraph(nx.gnp_random_graph(60, 0.1, seed=3))
+        for u, v in nx_graph.edges():
+            nx_graph.edges[u, v]["weight"] = rng.uniform()
+        eliminated = rng.choice(60, size=40, replace=False).tolist()
+        for num_processes in [2, 3]:
+            self.verify(nx_graph, eliminated, 1.5, num_processes=num_processes)
+
+    def test_fill_tasks(self):
+        # The shares of the paths hold every path once
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges([0, 1, 1, 2, 3, 3, 3], [1, 2, 3, 4, 4, 5, 6], 1.0)
+        graph = builder.finalize()
+        src, through, weight = np.array([0, 0, 2]), np.array([1, 3, 4]), np.ones(3)
+        expected = ldgm.graph.fill_edges(
+            *ldgm.graph.fill_tasks(graph, src, through, weight, 1)[0], np.inf
+        )
+        for num_tasks in [2, 3, 5]:
+            tasks = ldgm.graph.fill_tasks(graph, src, through, weight, num_tasks)
+            assert len(tasks) == num_tasks
+            filled = [ldgm.graph.fill_edges(*task, np.inf) for task in tasks]
+            edges = sorted(
+                zip(*[np.concatenate(arrays).tolist() for arrays in zip(*filled)])
+            )
+            assert edges == sorted(zip(*[array.tolist() for array in expected]))
+
+
+class TestBlockSubgraph(unittest.TestCase):
+    """
+    Test extracting relabeled subgraphs.
+    """
+
+    def test_block_subgraph(self):
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges(
+            [4, 4, 30, 17, 30], [30, 17, 46, 22, 4], [1.0, 2.0, 3.0, 4, 5]
+        )
+        graph = builder.finalize()
+        subgraph, blocks = graph.block_subgraph(np.array([4, 17, 30, 46]))
+        assert np.array_equal(blocks, [0, 2, 3, 5])
+        expected = nx.DiGraph()
+        expected.add_weighted_edges_from(
+            [(4, 22, 1.0), (4, 9, 2.0), (22, 30, 3.0), (22, 4, 5.0)]
+        )
+        assert subgraph.num_vertices == 32
+        assert nx.utils.graphs_equal(subgraph.to_networkx(), expected)
+
+
+class TestSharedArrays(unittest.TestCase):
+    """
+    Test sharing a CSR graph through shared memory.
+    """
+
+    def test_attach(self):
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges([0, 2, 1], [1, 0, 2], [0.5, 1.5, 2.5])
+        csr_graph = builder.finalize()
+        arrays = csr_graph.arrays()
+        arrays["empty"] = np.zeros(0, dtype=np.int32)
+        with ldgm.graph.SharedArrays.create(arrays) as shared:
+            attached = ldgm.graph.SharedArrays.attach(shared.spec)
+            for name, array in arrays.items():
+                assert np.array_equal(attached.arrays[name], array)
+                assert attached.arrays[name].dtype == array.dtype
+            graph = ldgm.graph.CSRGraph.from_arrays(attached.arrays)
+            assert nx.utils.graphs_equal(graph.to_networkx(), csr_graph.to_networkx())
+            del graph
+            attached.close()
+
+
+class TestTopologicalOrder(unittest.TestCase):
+    """
+    Test ordering the vertices of a CSR graph.
+    """
+
+    def test_brick_haplo_graph(self):
+        bts = ldgm.brick_ts(utility_functions.supplementary_example(), progress=False)
+        csr_graph = ldgm.brick_haplo_graph(bts, progress=False, as_networkx=False)
+        order = csr_graph.topological_order()
+        assert np.array_equal(np.sort(order), csr_graph.nodes())
+        position = np.zeros(csr_graph.num_vertices, dtype=int)
+        position[order] = np.arange(len(order))
+        src, dst, _ = csr_graph.edge_arrays()
+        assert np.all(position[src] < position[dst])
+
+    def test_cycle(self):
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges([0, 1, 2], [1, 2, 1], 1.0)
+        with self.assertRaises(ValueError):
+            builder.finalize().topological_order()
@@ -38,7 +38,7 @@ class TestNumNodes(unittest.TestCase):
         )
         bricked_graph = ldgm.brick_haplo_graph(bricked)
         reduced_graph = ldgm.reduce_graph(
-            bricked_graph, bricked, path_weight_threshold=None
+            bricked_graph, bricked, path_weight_threshold=None, as_networkx=True
         )
         num_brick_nodes = np.sum(np.array(list(reduced_graph.nodes())) >= 0)
         assert num_brick_nodes == number_of_labeled_bricks
@@ -170,3 +170,276 @@ class TestPathWeightThreshold(unittest.TestCase):
             reduced_8.get_edge_data(u, v)["weight"] for u, v in reduced_8.edges()
         ]
         assert np.max(edge_weights_8) < 8
+
+
+class TestReachStarEdges(unittest.TestCase):
+    """
+    Test the vectorized reach* edges match the edges from each reach set
+    """
+
+    def reach_star(self, out_node, reach_set, labeled, first_muts):
+        out_mut = first_muts[out_node // 8]
+        edges = []
+        for vertex, weight in reach_set.items():
+            brick = vertex // 8
+            if vertex % 8 in [0, 2] and labeled[brick]:
+                if brick * 8 + 1 not in reach_set and brick * 8 + 3 not in reach_set:
+                    edges.append((out_mut, first_muts[brick], weight, True))
+            elif vertex % 8 == 6 and vertex + 1 not in reach_set:
+                edges.append((out_mut, -brick - 1, weight, False))
+        return edges
+
+    def test_reach_sets(self):
+        labeled = np.array([True, False, True, True])
+        first_muts = np.array([0, -1, 1, 2])
+        out_nodes = [4, 20, 28]
+        reach_sets = [
+            {4: 0, 16: 1.0, 18: 1.5, 8: 0.5, 6: 0.5, 14: 2.0, 15: 2.0},
+            {},
+            {20: 0, 0: 1.0, 3: 2.0, 24: 0.5, 26: 0.5, 30: 3.0, 22: 1.0},
+        ]
+        edges = ldgm.reduction.reach_star_edges(
+            out_nodes, reach_sets, labeled, first_muts
+        )
+        expected = []
+        for out_node, reach_set in zip(out_nodes, reach_sets):
+            expected += self.reach_star(out_node, reach_set, labeled, first_muts)
+        assert list(zip(*[array.tolist() for array in edges])) == expected
+
+
+class TestReducedGraph(unittest.TestCase):
+    """
+    Test accumulating the reduced graph edges
+    """
+
+    def test_min_weight(self):
+        builder = ldgm.graph.GraphBuilder()
+        edges = (
+            np.array([0, 0, 2, 1]),
+            np.array([1, -3, 0, -3]),
+            np.array([2.0, 1.0, 0.5, 4.0]),
+            np.array([True, False, True, False]),
+        )
+        ldgm.reduction.add_reach_star_edges(builder, edges)
+        # The same SNP to SNP edge with a lower weight, from the other SNP
+        ldgm.reduction.add_reach_star_edges(builder, ([1], [0], [1.5], [True]))
+        reduced = ldgm.reduction.ReducedGraph.from_builder(
+            np.array([0, 1, 2, 5]), builder, 3
+        )
+        expected = nx.DiGraph()
+        expected.add_nodes_from([0, 1, 2, 5])
+        expected.add_weighted_edges_from(
+            [
+                (0, 1, 1.5),
+                (1, 0, 1.5),
+                (0, -3, 1.0),
+                (2, 0, 0.5),
+                (0, 2, 0.5),
+                (1, -3, 4.0),
+            ]
+        )
+        assert nx.utils.graphs_equal(reduced.to_networkx(), expected)
+
+    def test_compose(self):
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges([3, 3, 4, 5], [1, 4, 3, 0], [1.0, 2.0, 0.5, 3.0])
+        first = ldgm.reduction.ReducedGraph(np.array([1, 0]), builder.finalize(), 3)
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges([3, 4, 6], [4, 3, 0], [1.5, 0.25, 1.0])
+        second = ldgm.reduction.ReducedGraph(np.array([0, 3, 1]), builder.finalize(), 3)
+        composed = ldgm.reduction.ReducedGraph.compose([first, first.reverse(), second])
+        assert composed.nodes.tolist() == [1, 0, 3]
+        expected = nx.compose_all(
+            [second.to_networkx(), first.to_networkx(), nx.reverse(first.to_networkx())]
+        )
+        expected.add_weighted_edges_from([(0, 1, 0.5), (1, 0, 0.25)])
+        assert nx.utils.graphs_equal(composed.to_networkx(), expected)
+
+    def test_undirected(self):
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges(
+            [7, 5, 6, 7, 3, 4], [5, 7, 3, 6, 6, 7], [2.0, 1.0, 1.0, 0.5, 3.0, 4.0]
+        )
+        nodes = np.array([4, 2, 3, 0, 1])
+        reduced = ldgm.reduction.ReducedGraph(nodes, builder.finalize(), 3)
+        undirected = reduced.to_undirected_networkx(
+            node_ids=np.array([10, 11, 12, 13, 14])
+        )
+        assert list(undirected.nodes()) == [10, 11, 12, 13, 14]
+        assert list(undirected.edges(data="weight")) == [
+            (10, 11, 1.0),
+            (10, 12, 0.5),
+            (10, 14, 4.0),
+            (12, 13, 1.0),
+        ]
+        # The edges also in another graph come first
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges([6, 10], [7, 7], 1.0)
+        first = ldgm.reduction.ReducedGraph(nodes, builder.finalize(), 3)
+        undirected = reduced.to_undirected_networkx(first=first)
+        assert list(undirected.edges()) == [(4, 3), (4, 2), (4, 1), (3, 0)]
+
+
+class TestScheduleOutNodes(unittest.TestCase):
+    """
+    Test splitting out nodes into chunks for the reduce_graph workers
+    """
+
+    def test_chunks(self):
+        out_nodes = np.arange(4, 8 * 200, 8)
+        rng = np.random.default_rng(1)
+        costs = rng.exponential(size=len(out_nodes))
+        costs[17] = 100
+        positions = rng.uniform(size=len(out_nodes))
+        chunks = ldgm.reduction.schedule_out_nodes(
+            out_nodes, costs, positions, num_processes=4, chunksize=20
+        )
+        assert sorted(sum(chunks, [])) == out_nodes.tolist()
+        chunk_costs = []
+        for chunk in chunks:
+            assert len(chunk) <= 20
+            chunk_positions = positions[np.asarray(chunk) // 8]
+            # Chunks are runs of out nodes in genomic order
+            assert np.all(np.diff(chunk_positions) >= 0)
+            chunk_costs.append(np.sum(costs[np.asarray(chunk) // 8]))
+        # The expensive node is dispatched first, on its own
+        assert chunks[0] == [out_nodes[17]]
+        assert chunk_costs == sorted(chunk_costs, reverse=True)
+
+    def test_empty(self):
+        empty = np.zeros(0, dtype=int)
+        assert ldgm.reduction.schedule_out_nodes(empty, empty, empty, 4, 100) == []
+
+    def test_costs(self):
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges([4, 4, 8, 9, 12], [8, 9, 10, 10, 8], 1.0)
+        costs = ldgm.reduction.out_node_costs(builder.finalize(), np.array([4, 12]))
+        assert np.array_equal(costs, [5, 3])
+
+    def test_search_cost(self):
+        # With every out node in the sample, the cost is the exact total size
+        ts = utility_functions.supplementary_example()
+        bts = ldgm.brick_ts(ts, progress=False)
+        csr_graph = ldgm.brick_haplo_graph(bts, progress=False, as_networkx=False)
+        nodes = csr_graph.nodes()
+        out_nodes = nodes[nodes % 8 == 4].tolist()
+        reach_search = ldgm.search.ReachSearch(csr_graph, 100)
+        expected = sum(
+            len(reach_set) for _, reach_set in reach_search.reach_sets(out_nodes)
+        )
+        assert ldgm.reduction.search_cost(csr_graph, 100) == expected
+        empty = ldgm.graph.GraphBuilder().finalize()
+        assert ldgm.reduction.search_cost(empty, 100) == 0
+
+
+class TestWindows(unittest.TestCase):
+    """
+    Test sending workers the subgraphs around genomic windows of out nodes
+    """
+
+    def test_window_size(self):
+        ts = msprime.simulate(
+            30,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=5e4,
+            random_seed=11,
+        )
+        bts = ldgm.brick_ts(ts, progress=False)
+        bricked_graph = ldgm.brick_haplo_graph(bts, progress=False, as_networkx=False)
+        expected = ldgm.reduce_graph(
+            bricked_graph, bts, 4, progress=False, as_networkx=True
+        )
+        for window_size in [1e3, 1e4, 1e5]:
+            reduced_graph = ldgm.reduce_graph(
+                bricked_graph,
+                bts,
+                4,
+                num_processes=2,
+                progress=False,
+                window_size=window_size,
+                as_networkx=True,
+            )
+            assert nx.utils.graphs_equal(reduced_graph, expected)
+
+
+class TestSweep(unittest.TestCase):
+    """
+    Test the LDGMs of a sweep over thresholds match those made one at a time
+    """
+
+    def test_affected_out_nodes(self):
+        src = np.array([4, 8, 12])
+        dst = np.array([8, 16, 16])
+        weight = np.array([1.0, 1.0, 3.0])
+        brick_graph = ldgm.graph.csr_from_edges(src, dst, weight, num_vertices=24)
+        smaller_graph = ldgm.graph.csr_from_edges(
+            src[[0, 2]], dst[[0, 2]], weight[[0, 2]], num_vertices=24
+        )
+        affected = ldgm.reduction.affected_out_nodes(brick_graph, smaller_graph, 2.5)
+        assert affected.tolist() == [4]
+        affected = ldgm.reduction.affected_out_nodes(brick_graph, smaller_graph, 1.5)
+        assert affected.tolist() == []
+        affected = ldgm.reduction.affected_out_nodes(brick_graph, brick_graph, 10)
+        assert affected.tolist() == []
+        # Paths and missing edges of weight exactly the threshold
+        affected = ldgm.reduction.affected_out_nodes(brick_graph, smaller_graph, 2)
+        assert affected.tolist() == [4]
+        smaller_graph = ldgm.graph.csr_from_edges(
+            src[[1]], dst[[1]], weight[[1]], num_vertices=24
+        )
+        affected = ldgm.reduction.affected_out_nodes(brick_graph, smaller_graph, 1)
+        assert affected.tolist() == [4]
+        affected = ldgm.reduction.affected_out_nodes(brick_graph, smaller_graph, 3)
+        assert affected.tolist() == [4, 12]
+
+    def get_ts(self):
+        return msprime.simulate(
+            30,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=5e4,
+            random_seed=3,
+        )
+
+    def check_sweep(self, ts, thresholds, num_processes=1):
+        ldgms, _ = ldgm.make_ldgm_sweep(ts, thresholds, num_processes=num_processes)
+        assert len(ldgms) == len(thresholds)
+        for threshold, ldgm_graph in zip(thresholds, ldgms):
+            expected, _ = ldgm.make_ldgm(ts, threshold)
+            assert list(ldgm_graph.nodes()) == list(expected.nodes())
+            weights = {
+                frozenset((u, v)): weight
+                for u, v, weight in ldgm_graph.edges(data="weight")
+            }
+            expected_weights = {
+                frozenset((u, v)): weight
+                for u, v, weight in expected.edges(data="weight")
+            }
+            assert weights == pytest.approx(expected_weights)
+
+        return ldgms
+
+    def test_sweep(self):
+        ldgms = self.check_sweep(self.get_ts(), [4, 8, 2, 4])
+        assert ldgms[0] is not ldgms[3]
+
+    def test_multithreaded(self):
+        self.check_sweep(self.get_ts(), [4, 8, 2, 4], num_processes=3)
+
+    def test_zero_threshold(self):
+        ldgms = self.check_sweep(self.get_ts(), [0, 4])
+        assert ldgms[0].number_of_nodes() == 0
+
+    def test_edge_weight_threshold(self):
+        # Thresholds of exactly the weights of edges in the brick-haplo graphs
+        ts = self.get_ts()
+        bts = ldgm.brick_ts(ts)
+        weights = np.concatenate(
+            [brick_graph.weights for brick_graph in ldgm.brick_haplo_graphs(bts, 4)]
+        )
+        weights = np.unique(weights[(weights > 0) & (weights < 4)])
+        assert len(weights) > 0
+        self.check_sweep(ts, [4] + weights[:: max(1, len(weights) // 3)].tolist())
@@ -0,0 +1,319 @@
+"""
+Test cases for the bounded shortest path searches
+"""
+import unittest
+from unittest import mock
+
+import ldgm
+import msprime
+import networkx as nx
+import numpy as np
+import pytest
+
+from . import utility_functions
+
+
+class TestBoundedDijkstra(unittest.TestCase):
+    """
+    Test the bounded search with excluded vertices matches networkx on the
+    subgraph without those vertices.
+    """
+
+    def verify(self, ts, cutoff):
+        bts = ldgm.brick_ts(ts, progress=False)
+        csr_graph = ldgm.brick_haplo_graph(bts, progress=False, as_networkx=False)
+        nx_graph = csr_graph.to_networkx()
+        nodes = csr_graph.nodes()
+        for out_node in nodes[nodes % 8 == 4]:
+            excluded = set((out_node + ldgm.search.EXCLUDED_OFFSETS).tolist())
+            subgraph = nx_graph.subgraph(
+                [node for node in nx_graph.nodes() if node not in excluded]
+            )
+            expected = nx.single_source_dijkstra_path_length(
+                subgraph, out_node, cutoff=cutoff
+            )
+            reach_set = ldgm.search.bounded_dijkstra(
+                csr_graph, out_node, cutoff, excluded=excluded
+            )
+            assert reach_set.keys() == expected.keys()
+            for vertex, length in expected.items():
+                assert np.isclose(reach_set[vertex], length)
+
+    def test_examples(self):
+        for ts in [
+            utility_functions.figure_one_example(),
+            utility_functions.supplementary_example(),
+            utility_functions.triangle_example(),
+            utility_functions.multiple_snps_branch(),
+        ]:
+            self.verify(ts, None)
+
+    def test_simulated(self):
+        ts = msprime.simulate(
+            30,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=3e4,
+            random_seed=6,
+        )
+        for cutoff in [1, 4, 100]:
+            self.verify(ts, cutoff)
+
+
+class TestReachableVertices(unittest.TestCase):
+    """
+    Test the vertices reached from several sources are those of their reach sets.
+    """
+
+    def test_simulated(self):
+        ts = msprime.simulate(
+            30,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=3e4,
+            random_seed=10,
+        )
+        bts = ldgm.brick_ts(ts, progress=False)
+        csr_graph = ldgm.brick_haplo_graph(bts, progress=False, as_networkx=False)
+        nodes = csr_graph.nodes()
+        out_nodes = nodes[nodes % 8 == 4].tolist()
+        for sources in [out_nodes[:1], out_nodes[:10], out_nodes[5::3]]:
+            expected = set()
+            for source in sources:
+                expected |= ldgm.search.bounded_dijkstra(csr_graph, source, 2).keys()
+            vertices = ldgm.search.reachable_vertices(csr_graph, sources, 2)
+            assert vertices.tolist() == sorted(expected)
+
+
+class TestReachSearch(unittest.TestCase):
+    """
+    Test every ReachSearch backend finds the same reach sets.
+    """
+
+    def verify(self, ts, cutoff):
+        bts = ldgm.brick_ts(ts, progress=False)
+        csr_graph = ldgm.brick_haplo_graph(bts, progress=False, as_networkx=False)
+        nodes = csr_graph.nodes()
+        out_nodes = nodes[nodes % 8 == 4].tolist()
+        reference = dict(
+            ldgm.search.ReachSearch(csr_graph, cutoff, backend="networkx").reach_sets(
+                out_nodes
+            )
+        )
+        for backend in ["dijkstra", "scipy"]:
+            for batch_size in [None, 3]:
+                reach_search = ldgm.search.ReachSearch(
+                    csr_graph, cutoff, backend=backend, batch_size=batch_size
+                )
+                with mock.patch(
+                    "ldgm.search.bounded_dijkstra", wraps=ldgm.search.bounded_dijkstra
+                ) as bounded_dijkstra:
+                    reach_sets = list(reach_search.reach_sets(out_nodes))
+                if backend == "scipy":
+                    # Excluded vertices are masked in batch, without searching
+                    # again from any out node
+                    bounded_dijkstra.assert_not_called()
+                assert [out_node for out_node, _ in reach_sets] == out_nodes
+                for out_node, reach_set in reach_sets:
+                    expected = reference[out_node]
+                    assert reach_set.keys() == expected.keys()
+                    for vertex, length in expected.items():
+                        assert np.isclose(reach_set[vertex], length)
+
+    def test_examples(self):
+        for ts in [
+            utility_functions.figure_one_example(),
+            utility_functions.supplementary_example(),
+            utility_functions.triangle_example(),
+            utility_functions.multiple_snps_branch(),
+        ]:
+            self.verify(ts, None)
+
+    def test_simulated(self):
+        ts = msprime.simulate(
+            30,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=3e4,
+            random_seed=7,
+        )
+        for cutoff in [2, 4]:
+            self.verify(ts, cutoff)
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            ldgm.search.ReachSearch(ldgm.graph.GraphBuilder().finalize(), 4, "bfs")
+
+    def test_reduce_graph(self):
+        ts = utility_functions.supplementary_example()
+        reduced = [
+            ldgm.make_ldgm(
+                ts, path_weight_threshold=100, backend=backend, num_processes=2
+            )[0]
+            for backend in ["dijkstra", "networkx", "scipy", "tree"]
+        ]
+        for graph in reduced[1:]:
+            assert nx.utils.graphs_equal(graph, reduced[0])
+
+
+class TestTreeReachSets(unittest.TestCase):
+    """
+    Test the tree backend finds the reach sets of the exact search, restricted
+    to the vertices used by reach*.
+    """
+
+    def verify(self, ts, cutoff):
+        bts = ldgm.brick_ts(ts, progress=False)
+        labeled = ldgm.brickindex.BrickIndex.from_ts(bts).labeled
+        csr_graphs = ldgm.brick_haplo_graphs(bts, progress=False, as_networkx=False)
+        for csr_graph in csr_graphs:
+            nodes = csr_graph.nodes()
+            out_nodes = nodes[nodes % 8 == 4].tolist()
+            exact = ldgm.search.ReachSearch(csr_graph, cutoff)
+            tree = ldgm.search.ReachSearch(
+                csr_graph, cutoff, backend="tree", labeled=labeled
+            )
+            # Excluded vertices are handled within the pass, without searching
+            # again from out nodes whose paths return to their own brick
+            with mock.patch("ldgm.search.bounded_dijkstra", side_effect=AssertionError):
+                reach_sets = list(tree.reach_sets(out_nodes))
+            assert [out_node for out_node, _ in reach_sets] == out_nodes
+            for (_, expected), (_, reach_set) in zip(
+                exact.reach_sets(out_nodes), reach_sets
+            ):
+                expected = {
+                    vertex: length
+                    for vertex, length in expected.items()
+                    if tree.targets[vertex]
+                }
+                reach_set = {
+                    vertex: length
+                    for vertex, length in reach_set.items()
+                    if tree.targets[vertex]
+                }
+                assert reach_set.keys() == expected.keys()
+                for vertex, length in expected.items():
+                    assert np.isclose(reach_set[vertex], length)
+
+    def test_examples(self):
+        for ts in [
+            utility_functions.figure_one_example(),
+            utility_functions.supplementary_example(),
+            utility_functions.triangle_example(),
+            utility_functions.multiple_snps_branch(),
+        ]:
+            self.verify(ts, None)
+
+    def test_simulated(self):
+        ts = msprime.simulate(
+            30,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=3e4,
+            random_seed=9,
+        )
+        for cutoff in [2, 4]:
+            self.verify(ts, cutoff)
+
+    def test_all_targets(self):
+        # Without a mask of labeled bricks every reached vertex is kept
+        ts = utility_functions.supplementary_example()
+        bts = ldgm.brick_ts(ts, progress=False)
+        csr_graph = ldgm.brick_haplo_graph(bts, progress=False, as_networkx=False)
+        nodes = csr_graph.nodes()
+        out_nodes = nodes[nodes % 8 == 4].tolist()
+        exact = dict(ldgm.search.ReachSearch(csr_graph, 100).reach_sets(out_nodes))
+        tree = ldgm.search.ReachSearch(csr_graph, 100, backend="tree")
+        for out_node, reach_set in tree.reach_sets(out_nodes):
+            assert reach_set.keys() == exact[out_node].keys()
+
+
+class TestDialSearch(unittest.TestCase):
+    """
+    Test the dial search is within its error bound of the exact search.
+    """
+
+    def verify(self, ts, cutoff, epsilon):
+        bts = ldgm.brick_ts(ts, progress=False)
+        csr_graph = ldgm.brick_haplo_graph(bts, progress=False, as_networkx=False)
+        nodes = csr_graph.nodes()
+        out_nodes = nodes[nodes % 8 == 4].tolist()
+        exact = ldgm.search.ReachSearch(csr_graph, cutoff)
+        dial = ldgm.search.ReachSearch(
+            csr_graph, cutoff, backend="dial", epsilon=epsilon
+        )
+        # Bound on the error of paths with at most 100 edges
+        margin = 100 * epsilon / 2
+        for (_, expected), (_, reach_set) in zip(
+            exact.reach_sets(out_nodes), dial.reach_sets(out_nodes)
+        ):
+            for vertex, length in expected.items():
+                if length < cutoff - margin:
+                    assert abs(reach_set[vertex] - length) <= margin
+            for vertex, length in reach_set.items():
+                if length < cutoff - margin:
+                    assert vertex in expected
+
+    def test_examples(self):
+        for ts in [
+            utility_functions.figure_one_example(),
+            utility_functions.supplementary_example(),
+            utility_functions.multiple_snps_branch(),
+        ]:
+            self.verify(ts, 100, 1e-3)
+
+    def test_simulated(self):
+        ts = msprime.simulate(
+            30,
+            mutation_rate=1e-8,
+            recombination_rate=1e-8,
+            Ne=10000,
+            length=3e4,
+            random_seed=8,
+        )
+        # The number of buckets grows with cutoff / epsilon
+        for epsilon in [1e-4, 1e-3, 0.05]:
+            self.verify(ts, 4, epsilon)
+
+    def test_exact_weights(self):
+        # Weights which are multiples of epsilon give exact lengths
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges([4, 4, 8, 9, 10], [8, 9, 10, 10, 4], [0.5, 0, 0.25, 1, 0])
+        csr_graph = builder.finalize()
+        reach_set = ldgm.search.dial_search(
+            csr_graph,
+            4,
+            1,
+            0.25,
+            ldgm.search.quantize_weights(csr_graph.weights, 0.25),
+            excluded={9},
+        )
+        assert reach_set == {4: 0, 8: 0.5, 10: 0.75}
+
+    def test_circular_buckets(self):
+        # A path much longer than any edge wraps around the buckets, which are
+        # left empty for the next search
+        builder = ldgm.graph.GraphBuilder()
+        builder.add_edges(np.arange(10), np.arange(1, 11), np.full(10, 0.5))
+        builder.add_edges([0, 3], [5, 9], [3.0, 2.0])
+        csr_graph = builder.finalize()
+        quantized = ldgm.search.quantize_weights(csr_graph.weights, 0.5)
+        buckets = ldgm.search.dial_buckets(quantized, 4, 0.5)
+        assert len(buckets) == 7
+        for _ in range(2):
+            reach_set = ldgm.search.dial_search(
+                csr_graph, 0, 4, 0.5, quantized, buckets=buckets
+            )
+            expected = {vertex: vertex * 0.5 for vertex in range(9)}
+            expected.update({9: 3.5, 10: 4.0})
+            assert reach_set == expected
+            assert all(len(bucket) == 0 for bucket in buckets)
+
+    def test_no_cutoff(self):
+        with pytest.raises(ValueError):
+            graph = ldgm.graph.GraphBuilder().finalize()
+            ldgm.search.dial_search(graph, 0, None, 1, [])